@@ -1,17 +1,20 @@
 import os
+import asyncio
 import logging
+import time
 from langchain_aws import ChatBedrock
 from dotenv import load_dotenv
 
-from config import BEDROCK_MODEL_ID, BEDROCK_AWS_REGION
+from config import BEDROCK_MODEL_ID, BEDROCK_AWS_REGION, LLM_TIMEOUT_SECONDS, KNN_NEIGHBOURS, REASSESSMENT_BATCH_SIZE, OVERRIDE_GLOBAL_FALLBACK
 from vector_store import vector_store
 from schemas import AssessmentRequest, AssessmentResult
+from degraded_mode import llm_health, knn_triage
+from database import get_pending_reassessments, record_reassessment_attempt, complete_reassessment
+from logging_config import summarize_text, LazySummary, annotate, timed
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_bedrock_llm():
@@ -35,7 +38,45 @@ def get_bedrock_llm():
         # Ensure AWS credentials are configured correctly in your environment.
         raise
 
-llm = get_bedrock_llm()
+llm = None
+
+def get_llm():
+    """
+    Returns the Bedrock client, creating it on first use.
+    A failure here must not take the service down, so it trips degraded mode instead of raising.
+    """
+    global llm
+    if llm is None:
+        try:
+            llm = get_bedrock_llm()
+        except Exception as e:
+            llm_health.trip(f"Bedrock client unavailable: {e}")
+            return None
+    return llm
+
+async def invoke_llm(prompt) -> str | None:
+    """
+    Invokes Bedrock off the event loop with a timeout, recording latency and
+    errors for the degraded-mode SLO. Returns None if the call failed.
+    """
+    client = get_llm()
+    if client is None:
+        return None
+
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(asyncio.to_thread(client.invoke, prompt), timeout=LLM_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        llm_health.record(time.perf_counter() - start, succeeded=False)
+        logger.error(f"Bedrock call timed out after {LLM_TIMEOUT_SECONDS}s.")
+        return None
+    except Exception as e:
+        llm_health.record(time.perf_counter() - start, succeeded=False)
+        logger.error(f"Bedrock call failed: {e}")
+        return None
+
+    llm_health.record(time.perf_counter() - start, succeeded=True)
+    return response.content
 
 def parse_assessment_response(response_content: str) -> AssessmentResult:
     """Parses the raw text response from the LLM into a structured format."""
@@ -50,50 +91,22 @@ def parse_assessment_response(response_content: str) -> AssessmentResult:
 
         return AssessmentResult(score=score, triage=triage, explanation=explanation)
     except Exception as e:
-        logger.error(f"Error parsing LLM response: {e}\nRaw response: {response_content}")
+        logger.error(f"Error parsing LLM response: {e}", extra={"response": summarize_text(response_content)})
         return AssessmentResult(score="Error", triage="Error", explanation=f"Failed to parse LLM response: {response_content}")
 
 
-async def assess_engagement(request: AssessmentRequest) -> (AssessmentResult, dict | None):
+async def run_llm_assessment(engagement_details: str) -> AssessmentResult | None:
     """
-    Assesses engagement details against HMRC guidelines, using the vector store and Bedrock LLM.
-    If a similar overridden case is found, it returns that result directly.
-    Otherwise, it performs a new AI assessment.
+    Performs a full assessment against the HMRC guidelines with the Bedrock LLM.
+    Returns None if the LLM could not be reached.
     """
-    engagement_details = request.engagement_details
-    logger.info("Starting engagement assessment..." + engagement_details)
-
-    # 1. Check for similar overridden engagements first
-    similar_override, distance = vector_store.find_similar_override(engagement_details)
-    
-    if similar_override:
-        logger.info("Similar override found. Skipping new AI assessment and returning stored result.")
-        
-        human_override_details = similar_override['human_override']
-        
-        # Create an AssessmentResult object from the stored human override data.
-        assessment_result = AssessmentResult(
-            score=human_override_details['score'],
-            triage=human_override_details.get('triage') or "N/A", # Use .get for safety
-            explanation=(
-                f"This assessment is based on a previous human override for a similar case (L2 Distance: {distance:.2f}).\n\n"
-                f"**Original Engagement:**\n> {similar_override['original_engagement_details']}\n\n"
-                f"**Human Override Reason:**\n> {human_override_details['reason']}"
-            )
-        )
-        
-        # Return the result from the override and the override object itself
-        return assessment_result, similar_override
-
-    # If no similar override is found, proceed with a new AI assessment.
-    logger.info("No similar override found. Proceeding with new AI assessment.")
-    
-    # 2. Retrieve relevant HMRC guidelines
-    relevant_guidelines = vector_store.find_similar_guidelines(engagement_details, n_results=5)
+    # 1. Retrieve relevant HMRC guidelines
+    with timed("guidelines_ms"):
+        relevant_guidelines = vector_store.find_similar_guidelines(engagement_details, n_results=5)
     guidelines_text = "\n---\n".join(relevant_guidelines)
-    logger.info(f"Retrieved {len(relevant_guidelines)} relevant guideline chunks.")
+    logger.debug("Retrieved %d relevant guideline chunks.", len(relevant_guidelines))
 
-    # 3. Construct prompt for Bedrock
+    # 2. Construct prompt for Bedrock
     system_message = (
         "You are an AI assistant specialized in HMRC IR35 (off-payroll working) rules. "
         "Your task is to assess a contingent worker engagement description based on provided HMRC guidelines."
@@ -123,14 +136,115 @@ async def assess_engagement(request: AssessmentRequest) -> (AssessmentResult, di
 
     prompt = [("system", system_message), ("user", user_message)]
 
-    # 4. Call Bedrock API
-    logger.info("Invoking Bedrock model...")
-    response = llm.invoke(prompt)
-    assessment_content = response.content
-    logger.info("Received response from Bedrock.")
+    # 3. Call Bedrock API
+    logger.debug("Invoking Bedrock model...")
+    with timed("llm_ms"):
+        assessment_content = await invoke_llm(prompt)
+    if assessment_content is None:
+        return None
+    logger.debug("Received response from Bedrock.", extra={"response": LazySummary(assessment_content)})
+
+    # 4. Parse the response
+    return parse_assessment_response(assessment_content)
+
 
-    # 5. Parse the response
-    assessment_result = parse_assessment_response(assessment_content)
+async def assess_engagement(request: AssessmentRequest) -> (AssessmentResult, dict | None):
+    """
+    Assesses engagement details against HMRC guidelines, using the vector store and Bedrock LLM.
+    If a similar overridden case is found, it returns that result directly.
+    If degraded mode is active, fast triage was requested, or the LLM call fails,
+    it returns a provisional k-NN triage over past decisions.
+    Otherwise, it performs a new AI assessment.
+    """
+    engagement_details = request.engagement_details
+    logger.debug("Starting engagement assessment...", extra={"engagement": LazySummary(engagement_details)})
+
+    # 1. Check for similar overridden engagements first, within the request's partition
+    with timed("override_lookup_ms"):
+        similar_override, distance = vector_store.find_similar_override(
+            engagement_details,
+            business_unit=request.business_unit,
+            engagement_category=request.engagement_category,
+            global_fallback=OVERRIDE_GLOBAL_FALLBACK if request.global_fallback is None else request.global_fallback,
+        )
+    
+    if similar_override:
+        logger.debug("Similar override found. Skipping new AI assessment and returning stored result.")
+        annotate(outcome="override_reuse", override_distance=round(distance, 4))
+        
+        human_override_details = similar_override['human_override']
+        
+        # Create an AssessmentResult object from the stored human override data.
+        assessment_result = AssessmentResult(
+            score=human_override_details['score'],
+            triage=human_override_details.get('triage') or "N/A", # Use .get for safety
+            explanation=(
+                f"This assessment is based on a previous human override for a similar case (L2 Distance: {distance:.2f}).\n\n"
+                f"**Original Engagement:**\n> {similar_override['original_engagement_details']}\n\n"
+                f"**Human Override Reason:**\n> {human_override_details['reason']}"
+            )
+        )
+        
+        # Return the result from the override and the override object itself
+        return assessment_result, similar_override
+
+    # 2. Answer from past decisions when the LLM is unhealthy or fast triage was requested
+    if request.fast_triage or llm_health.is_degraded():
+        reason = "fast triage requested" if request.fast_triage else "degraded mode"
+        logger.debug("Returning provisional k-NN triage (%s).", reason)
+        annotate(outcome="provisional", provisional_reason=reason)
+        with timed("knn_ms"):
+            neighbours = vector_store.find_nearest_decisions(
+                engagement_details, n_results=KNN_NEIGHBOURS,
+                business_unit=request.business_unit, engagement_category=request.engagement_category
+            )
+        return knn_triage(neighbours, reason), None
+
+    # If no similar override is found, proceed with a new AI assessment.
+    logger.debug("No similar override found. Proceeding with new AI assessment.")
+    assessment_result = await run_llm_assessment(engagement_details)
+    if assessment_result is None:
+        logger.warning("LLM assessment failed. Falling back to provisional k-NN triage.")
+        annotate(outcome="provisional", provisional_reason="LLM unavailable")
+        with timed("knn_ms"):
+            neighbours = vector_store.find_nearest_decisions(
+                engagement_details, n_results=KNN_NEIGHBOURS,
+                business_unit=request.business_unit, engagement_category=request.engagement_category
+            )
+        return knn_triage(neighbours, "LLM unavailable"), None
+
+    annotate(outcome="llm")
     
     # Return the new assessment and no similar case
     return assessment_result, None
+
+
+async def reassess_pending():
+    """
+    Re-assesses queued provisional assessments with the LLM, replacing their results.
+    Stops as soon as the LLM cannot be reached so an unhealthy LLM is not hammered; an outage
+    is not the item's fault and does not count as an attempt. Unparseable responses do count.
+    """
+    pending = get_pending_reassessments(limit=REASSESSMENT_BATCH_SIZE)
+    if not pending:
+        return
+    logger.info(f"Re-assessing {len(pending)} provisional assessments...")
+
+    for item in pending:
+        if llm_health.is_degraded():
+            logger.info("Degraded mode is active. Postponing remaining re-assessments.")
+            return
+        assessment_id = item['assessment_id']
+        result = await run_llm_assessment(item['engagement_details'])
+        if result is None:
+            logger.warning(f"LLM unavailable while re-assessing assessment {assessment_id}. Will retry later.")
+            return
+        if result.score == "Error":
+            record_reassessment_attempt(assessment_id)
+            logger.warning(f"Re-assessment of assessment {assessment_id} failed (attempt {item['attempts'] + 1}). Will retry later.")
+            continue
+        complete_reassessment(assessment_id, result.score, result.triage, result.explanation)
+        vector_store.add_assessment(
+            assessment_id, item['engagement_details'], result.score, result.triage,
+            item['business_unit'], item['engagement_category']
+        )
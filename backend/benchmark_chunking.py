@@ -0,0 +1,101 @@
+"""
+Benchmark of guideline parse and chunk throughput on saved HTML fixtures (no network).
+
+Compares the legacy greedy character chunker on 'html.parser' with the
+structure-aware chunker on each parser backend, serially and in a process pool.
+
+Usage:
+    python benchmark_chunking.py --copies 50 --workers 4
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+from typing import List, Tuple
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from data_loader import make_soup, process_guideline_html, process_pages, count_tokens
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "guidelines")
+
+def load_fixtures(fixtures_dir: str, copies: int) -> List[Tuple[str, bytes]]:
+    """Loads the saved pages, repeated `copies` times to simulate a larger crawl."""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(path, "rb") as f:
+            pages.append((f"file://{os.path.abspath(path)}", f.read()))
+    return pages * copies
+
+def legacy_chunks(html: bytes, url: str) -> List[str]:
+    """The original greedy character chunker, kept here as the baseline."""
+    soup = make_soup(html, 'html.parser')
+    main_content = soup.find(id='wrapper') or soup.find('article') or soup.find('body')
+    text_elements = main_content.find_all(['p', 'li', 'h2', 'h3', 'h4'])
+    raw_text_chunks = [
+        element.get_text(separator=" ", strip=True)
+        for element in text_elements
+        if element.get_text(separator=" ", strip=True)
+    ]
+    chunks, current_chunk, min_chunk_length = [], "", 100
+    for segment in raw_text_chunks:
+        if len(current_chunk) + len(segment) < min_chunk_length * 2:
+            current_chunk += " " + segment
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = segment
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return [chunk for chunk in chunks if len(chunk) > 50 and any(char.isalpha() for char in chunk)]
+
+def parser_available(backend: str) -> bool:
+    try:
+        BeautifulSoup("", backend)
+        return True
+    except FeatureNotFound:
+        return False
+
+def run(name: str, func, pages: List[Tuple[str, bytes]], repeats: int):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = func(pages)
+        timings.append(time.perf_counter() - start)
+    elapsed = statistics.median(timings)
+    texts = [chunk if isinstance(chunk, str) else chunk.text for chunk in chunks]
+    megabytes = sum(len(html) for _, html in pages) / 1_000_000
+    tokens = [count_tokens(text) for text in texts]
+    print(
+        f"{name:<34} {elapsed * 1000:>9.1f} {len(pages) / elapsed:>9.1f} {megabytes / elapsed:>7.2f} "
+        f"{len(texts):>7} {statistics.mean(tokens) if tokens else 0:>7.1f} {max(tokens, default=0):>7}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark guideline parsing and chunking on saved HTML fixtures.")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory of saved .html pages.")
+    parser.add_argument("--copies", type=int, default=50, help="How many times to repeat the fixture set.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per configuration; the median is reported.")
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1), help="Process pool size.")
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.fixtures, args.copies)
+    if not pages:
+        print(f"No .html fixtures found in {args.fixtures}")
+        return
+    print(f"{len(pages)} pages ({len(pages) // args.copies} fixtures x {args.copies})\n")
+
+    header = f"{'configuration':<34} {'ms':>9} {'pages/s':>9} {'MB/s':>7} {'chunks':>7} {'avg tok':>7} {'max tok':>7}"
+    print(header)
+    print("-" * len(header))
+    run("legacy greedy, html.parser", lambda p: [c for url, html in p for c in legacy_chunks(html, url)], pages, args.repeats)
+    for backend in ["html.parser", "lxml"]:
+        if not parser_available(backend):
+            print(f"{'structured, ' + backend:<34} (not installed)")
+            continue
+        run(f"structured, {backend}", lambda p: [c for url, html in p for c in process_guideline_html(html, url, parser=backend)], pages, args.repeats)
+    run(f"structured, default, {args.workers} processes", lambda p: process_pages(p, workers=args.workers), pages, args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -15,14 +15,92 @@ HMRC_URL_PATHS = [
 
 FULL_HMRC_URLS = [HMRC_GUIDANCE_URL + path for path in HMRC_URL_PATHS]
 
+# Guideline chunking
+# Chunks follow the h2/h3 section structure and are limited by token count.
+# MiniLM truncates at 256 word pieces, so stay well below that.
+CHUNK_MAX_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 30
+CHUNK_MIN_CHARACTERS = 50
+# BeautifulSoup parser backend; falls back to 'html.parser' if lxml is not installed.
+HTML_PARSER = "lxml"
+# Pages are parsed and chunked in a process pool of this size (1 disables the pool).
+# Parsing takes about 2 ms per page, while starting spawned workers takes seconds, so the
+# pool only pays off for thousands of pages on a multi-core host. Measure with
+# benchmark_chunking.py before raising it.
+GUIDELINE_PARSE_WORKERS = 1
+GUIDELINE_FETCH_WORKERS = 8
+
 # Embedding Model
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
 
 # ChromaDB
 CHROMA_DB_PATH = "./chroma_db"
-HMRC_COLLECTION_NAME = "hmrc_guidelines"
+# Bumped when the guideline chunk format changes, so the collection is rebuilt.
+HMRC_COLLECTION_NAME = "hmrc_guidelines_v2"
 OVERRIDE_COLLECTION_NAME = "overridden_engagements"
+ASSESSMENT_COLLECTION_NAME = "assessment_history"
+
+# Override lookup
+# Maximum distance (squared L2, as reported by ChromaDB) at which a stored
+# human override is reused instead of calling the LLM.
+# Calibrate with `python replay_overrides.py`.
+OVERRIDE_SIMILARITY_THRESHOLD = 0.5
+# Overrides are stored in one collection per (business unit, engagement category)
+# partition. A lookup with only some keys searches every partition matching them.
+# When enabled, a miss is retried against all other partitions (one query per
+# partition) with the stricter OVERRIDE_GLOBAL_FALLBACK_THRESHOLD, to limit
+# matches across business units.
+OVERRIDE_GLOBAL_FALLBACK = False
+OVERRIDE_GLOBAL_FALLBACK_THRESHOLD = 0.3
+# Override embeddings can be written to a memory-mappable .npy snapshot (plus a
+# .json manifest) and restored without re-encoding. float16 halves the file size.
+OVERRIDE_SNAPSHOT_PATH = "./snapshots/overrides"
+OVERRIDE_SNAPSHOT_DTYPE = "float16"
 
 # Bedrock
 BEDROCK_MODEL_ID = 'anthropic.claude-3-5-sonnet-20240620-v1:0'
 BEDROCK_AWS_REGION = 'us-east-1'
+# Calls slower than this are abandoned and answered in degraded mode.
+LLM_TIMEOUT_SECONDS = 30
+
+# Degraded (k-NN) triage mode
+# Degraded mode switches on automatically when, over the last LLM_HEALTH_WINDOW
+# calls, the p90 latency exceeds LLM_LATENCY_SLO_SECONDS or the error rate
+# exceeds LLM_ERROR_RATE_SLO. It stays on for DEGRADED_MODE_COOLDOWN_SECONDS.
+LLM_HEALTH_WINDOW = 20
+LLM_HEALTH_MIN_SAMPLES = 3
+LLM_LATENCY_SLO_SECONDS = 20
+LLM_ERROR_RATE_SLO = 0.5
+DEGRADED_MODE_COOLDOWN_SECONDS = 120
+KNN_NEIGHBOURS = 7
+# Votes from human overrides count this many times more than AI assessments.
+KNN_OVERRIDE_WEIGHT = 3.0
+# How often provisional assessments are re-assessed by the LLM.
+REASSESSMENT_INTERVAL_SECONDS = 60
+REASSESSMENT_BATCH_SIZE = 10
+# Queued items are retried least-attempted first; after this many unparseable LLM responses
+# an item is no longer retried and keeps its provisional result. LLM outages are not counted.
+REASSESSMENT_MAX_ATTEMPTS = 5
+
+# HTTP responses
+# Bodies smaller than this (in bytes) are sent uncompressed.
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+GZIP_COMPRESSION_LEVEL = 6
+BROTLI_COMPRESSION_QUALITY = 5
+
+# Assessment search
+SEARCH_MAX_PAGE_SIZE = 100
+# Reciprocal rank fusion constant used when merging lexical and vector hits.
+SEARCH_RRF_K = 60
+# Vector hits with a larger distance than this are not merged into search results.
+SEARCH_MAX_VECTOR_DISTANCE = 1.2
+
+# Logging
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"  # "json" or "text"
+LOG_FILE = None  # Also write logs to this file when set
+# Free-text payloads (engagement details, LLM output) are logged as a length and
+# hash. Set a preview length > 0 to also log the first characters (may contain PII).
+LOG_PAYLOAD_PREVIEW_CHARS = 0
+# Share of requests whose DEBUG detail is logged (0 disables debug logging).
+LOG_DEBUG_SAMPLE_RATE = 0.01
@@ -1,67 +1,224 @@
+import multiprocessing
+import re
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 import logging
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Tuple, Callable, Optional
+
+from config import (
+    CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_CHARACTERS, HTML_PARSER,
+    GUIDELINE_PARSE_WORKERS, GUIDELINE_FETCH_WORKERS
+)
+from schemas import GuidelineChunk
+from logging_config import setup_worker_logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fetch_and_process_guidelines(url: str) -> List[str]:
-    """Fetches content from a URL, extracts text, and chunks it."""
+SECTION_HEADINGS = {'h2': 1, 'h3': 2}
+TEXT_ELEMENTS = {'p', 'li', 'h4'}
+
+# Word pieces are approximated by words and punctuation marks, which avoids loading
+# the embedding tokenizer in every worker process. It slightly undercounts, hence
+# the headroom in CHUNK_MAX_TOKENS.
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Approximates the number of embedding-model tokens in a text."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+def make_soup(html: bytes | str, parser: str = HTML_PARSER) -> BeautifulSoup:
+    """Parses HTML with the configured backend, falling back to the pure-Python parser."""
+    try:
+        return BeautifulSoup(html, parser)
+    except FeatureNotFound:
+        logger.warning(f"HTML parser '{parser}' is not installed. Falling back to 'html.parser'.")
+        return BeautifulSoup(html, 'html.parser')
+
+def extract_sections(soup: BeautifulSoup) -> List[Tuple[List[str], List[str]]]:
+    """
+    Splits the main content of a page into sections following its h2/h3 structure.
+    Returns (heading_path, text_segments) pairs in document order.
+    """
+    main_content = soup.find(id='wrapper') or soup.find('article') or soup.find('body')
+    if not main_content:
+        return []
+
+    sections = []
+    heading_path: List[str] = []
+    segments: List[str] = []
+    # Single pass over the tree. Text elements are not descended into, so only the
+    # outermost one is taken and nested list items are not duplicated.
+    stack = list(reversed(main_content.contents))
+    while stack:
+        element = stack.pop()
+        name = getattr(element, 'name', None)
+        if name is None:
+            continue
+        if name in SECTION_HEADINGS:
+            text = element.get_text(separator=" ", strip=True)
+            if not text:
+                continue
+            if segments:
+                sections.append((heading_path, segments))
+            level = SECTION_HEADINGS[name]
+            heading_path = heading_path[:level - 1] + [text]
+            segments = []
+        elif name in TEXT_ELEMENTS:
+            text = element.get_text(separator=" ", strip=True)
+            if text:
+                segments.append(text)
+        else:
+            stack.extend(reversed(element.contents))
+    if segments:
+        sections.append((heading_path, segments))
+    return sections
+
+def _tail(text: str, max_tokens: int, counter: Callable[[str], int]) -> str:
+    """Returns the trailing words of a text that fit within max_tokens."""
+    words = text.split()
+    kept, tokens = [], 0
+    for word in reversed(words):
+        tokens += counter(word)
+        if tokens > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(reversed(kept))
+
+def _split_long_segment(segment: str, max_tokens: int, overlap_tokens: int, counter: Callable[[str], int]) -> List[str]:
+    """Splits a segment that exceeds max_tokens into overlapping word windows."""
+    pieces, current, tokens = [], [], 0
+    for word in segment.split():
+        word_tokens = counter(word)
+        if current and tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            overlap = _tail(pieces[-1], overlap_tokens, counter)
+            current = overlap.split() if overlap else []
+            tokens = counter(overlap) if overlap else 0
+        current.append(word)
+        tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def chunk_section(
+    segments: List[str],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    counter: Callable[[str], int] = count_tokens,
+) -> List[str]:
+    """
+    Packs the text segments of one section into chunks of at most max_tokens,
+    breaking between segments where possible. Each chunk after the first starts
+    with up to overlap_tokens of the previous chunk's tail.
+    """
+    chunks = []
+    current, tokens = "", 0
+    for segment in segments:
+        segment_tokens = counter(segment)
+        if segment_tokens > max_tokens:
+            if current:
+                chunks.append(current)
+                # Carry the previous chunk's tail into the first window of the long segment.
+                overlap = _tail(current, overlap_tokens, counter)
+                segment = f"{overlap} {segment}".strip()
+            pieces = _split_long_segment(segment, max_tokens, overlap_tokens, counter)
+            chunks.extend(pieces[:-1])
+            current, tokens = pieces[-1], counter(pieces[-1])
+            continue
+        if current and tokens + segment_tokens > max_tokens:
+            chunks.append(current)
+            overlap = _tail(current, min(overlap_tokens, max_tokens - segment_tokens), counter)
+            current, tokens = overlap, counter(overlap)
+        current = f"{current} {segment}".strip()
+        tokens += segment_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def process_guideline_html(
+    html: bytes | str,
+    url: str,
+    parser: str = HTML_PARSER,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[GuidelineChunk]:
+    """
+    Parses a guideline page and chunks it section by section.
+    Each chunk's text is prefixed with its heading path so headings stay in context.
+    """
+    soup = make_soup(html, parser)
+    sections = extract_sections(soup)
+    if not sections:
+        logger.error(f"Could not find main content on the page: {url}")
+        return []
+
+    chunks = []
+    for heading_path, segments in sections:
+        heading = " > ".join(heading_path)
+        # The heading prefix counts towards the token limit.
+        budget = max(max_tokens - count_tokens(heading), overlap_tokens + 1)
+        for body in chunk_section(segments, budget, overlap_tokens):
+            text = f"{heading}\n{body}" if heading else body
+            # Filter out very short or non-alphabetic chunks
+            if len(body) > CHUNK_MIN_CHARACTERS and any(char.isalpha() for char in body):
+                chunks.append(GuidelineChunk(text=text, source_url=url, heading_path=heading_path))
+    return chunks
+
+def fetch_guideline_html(url: str) -> Optional[bytes]:
+    """Fetches the raw HTML of a guideline page."""
     try:
         # Using verify=False to bypass SSL verification issues, similar to the reference program.
         # In a production environment, it's better to handle SSL properly.
         response = requests.get(url, verify=False)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        main_content = soup.find(id='wrapper') or soup.find('article') or soup.find('body')
-        if not main_content:
-            logger.error(f"Could not find main content on the page: {url}")
-            return []
-
-        text_elements = main_content.find_all(['p', 'li', 'h2', 'h3', 'h4'])
-        raw_text_chunks = [
-            element.get_text(separator=" ", strip=True)
-            for element in text_elements
-            if element.get_text(separator=" ", strip=True)
-        ]
-
-        # Simple chunking strategy based on the reference implementation
-        chunks = []
-        current_chunk = ""
-        min_chunk_length = 100
-
-        for segment in raw_text_chunks:
-            if len(current_chunk) + len(segment) < min_chunk_length * 2:
-                current_chunk += " " + segment
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = segment
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-
-        # Filter out very short or non-alphabetic chunks
-        filtered_chunks = [chunk for chunk in chunks if len(chunk) > 50 and any(char.isalpha() for char in chunk)]
-        
-        logger.info(f"Successfully processed and chunked content from {url}")
-        return filtered_chunks
-
+        return response.content
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching HMRC guidelines from {url}: {e}")
+        return None
+
+def fetch_and_process_guidelines(url: str) -> List[GuidelineChunk]:
+    """Fetches content from a URL, extracts text, and chunks it."""
+    html = fetch_guideline_html(url)
+    if html is None:
+        return []
+    try:
+        chunks = process_guideline_html(html, url)
+        logger.info(f"Successfully processed and chunked content from {url}")
+        return chunks
+    except Exception as e:
+        logger.error(f"An error occurred during content processing for {url}: {e}")
         return []
+
+def _process_page(page: Tuple[str, bytes | str]) -> List[GuidelineChunk]:
+    url, html = page
+    try:
+        return process_guideline_html(html, url)
     except Exception as e:
         logger.error(f"An error occurred during content processing for {url}: {e}")
         return []
 
-def load_all_guidelines(urls: List[str]) -> List[str]:
+def process_pages(pages: List[Tuple[str, bytes | str]], workers: int = GUIDELINE_PARSE_WORKERS) -> List[GuidelineChunk]:
+    """Parses and chunks (url, html) pages, in a process pool when more than one worker is configured."""
+    if workers <= 1 or len(pages) <= 1:
+        results = [_process_page(page) for page in pages]
+    else:
+        workers = min(workers, len(pages))
+        # Spawn rather than fork: by now the embedding model and ChromaDB have started
+        # threads, and forking a multi-threaded process can deadlock the children.
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=setup_worker_logging
+        ) as pool:
+            # Batch pages per task to keep inter-process overhead low for small pages.
+            results = list(pool.map(_process_page, pages, chunksize=max(1, len(pages) // (workers * 4))))
+    return [chunk for page_chunks in results for chunk in page_chunks]
+
+def load_all_guidelines(urls: List[str]) -> List[GuidelineChunk]:
     """Loads and processes content from a list of URLs."""
-    all_chunks = []
     logger.info("Starting to fetch all HMRC guidelines...")
-    for url in urls:
-        chunks = fetch_and_process_guidelines(url)
-        all_chunks.extend(chunks)
-    logger.info(f"Finished fetching guidelines. Total chunks: {len(all_chunks)}")
+    with ThreadPoolExecutor(max_workers=max(1, min(GUIDELINE_FETCH_WORKERS, len(urls)))) as pool:
+        pages = [(url, html) for url, html in zip(urls, pool.map(fetch_guideline_html, urls)) if html is not None]
+
+    all_chunks = process_pages(pages)
+    logger.info(f"Finished fetching guidelines. Total chunks: {len(all_chunks)} from {len(pages)} pages")
     return all_chunks
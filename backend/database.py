@@ -1,21 +1,43 @@
+import html
+import re
 import sqlite3
 import logging
 from typing import List, Optional, Dict, Any
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from config import REASSESSMENT_MAX_ATTEMPTS
+from logging_config import summarize_text, LazySummary
+
 logger = logging.getLogger(__name__)
 
 DATABASE_URL = "sqlite:///./assessments.db"
 DB_FILE = "assessments.db"
 DDL_SCRIPT = "database_setup.sql"
 
+# Columns added to assessments after its first release, created on existing databases by create_database
+ADDED_ASSESSMENT_COLUMNS = {"business_unit": "TEXT", "engagement_category": "TEXT"}
+
+# Whether an assessment is a provisional result still waiting in the re-assessment queue
+PROVISIONAL_COLUMN = "EXISTS (SELECT 1 FROM reassessment_queue q WHERE q.assessment_id = a.id) AS provisional"
+
+# bm25 column weights for assessments_fts: engagement_details, explanation, human_override_reason
+FTS_COLUMN_WEIGHTS = (2.0, 1.0, 1.5)
+
+# Private-use characters that mark matches in FTS snippets until the text is HTML-escaped
+SNIPPET_MATCH_START = "\ue000"
+SNIPPET_MATCH_END = "\ue001"
+
 def get_db_connection(db_file: str = DB_FILE):
     """Creates and returns a database connection."""
     conn = sqlite3.connect(db_file)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _assessment_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Converts an assessment row selected with PROVISIONAL_COLUMN into a dict."""
+    record = dict(row)
+    record["provisional"] = bool(record["provisional"])
+    return record
+
 def create_database():
     """Creates the database and table from the DDL script."""
     try:
@@ -24,6 +46,11 @@ def create_database():
         
         with get_db_connection() as conn:
             conn.executescript(ddl_script)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(assessments)")}
+            for column, column_type in ADDED_ASSESSMENT_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE assessments ADD COLUMN {column} {column_type}")
+                    logger.info(f"Added column '{column}' to the assessments table.")
             logger.info("Database and table created successfully.")
     except FileNotFoundError:
         logger.error(f"DDL script '{DDL_SCRIPT}' not found.")
@@ -32,24 +59,24 @@ def create_database():
         logger.error(f"Database error: {e}")
         raise
 
-def save_assessment(engagement_details: str, score: str, triage: str, explanation: str, db_connection=None) -> int:
-    """Saves an AI assessment to the database."""
+def save_assessment(engagement_details: str, score: str, triage: str, explanation: str, db_connection=None, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> int:
+    """Saves an AI assessment to the database, with the partition keys it was made under."""
     conn = db_connection if db_connection else get_db_connection()
     try:
         with conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
-                INSERT INTO assessments (engagement_details, score, triage, explanation)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO assessments (engagement_details, score, triage, explanation, business_unit, engagement_category)
+                VALUES (?, ?, ?, ?, ?, ?)
                 """,
-                (engagement_details, score, triage, explanation)
+                (engagement_details, score, triage, explanation, business_unit, engagement_category)
             )
             conn.commit()
-            logger.info(f"Saved assessment for engagement: {engagement_details[:50]}...")
             if cursor.lastrowid is None:
                 logger.error("Failed to retrieve lastrowid after insert.")
                 raise ValueError("Failed to retrieve lastrowid after insert.")
+            logger.debug("Saved assessment %s", cursor.lastrowid, extra={"engagement": LazySummary(engagement_details)})
             return cursor.lastrowid
     except sqlite3.Error as e:
         logger.error(f"Failed to save assessment: {e}")
@@ -61,9 +88,9 @@ def get_assessment(assessment_id: int, db_connection=None) -> Optional[Dict[str,
     try:
         with conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM assessments WHERE id = ?", (assessment_id,))
+            cursor.execute(f"SELECT a.*, {PROVISIONAL_COLUMN} FROM assessments a WHERE a.id = ?", (assessment_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return _assessment_row(row) if row else None
     except sqlite3.Error as e:
         logger.error(f"Failed to retrieve assessment {assessment_id}: {e}")
         raise
@@ -74,15 +101,38 @@ def get_all_assessments(db_connection=None) -> List[Dict[str, Any]]:
     try:
         with conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM assessments ORDER BY created_at DESC")
+            cursor.execute(f"SELECT a.*, {PROVISIONAL_COLUMN} FROM assessments a ORDER BY a.created_at DESC")
             rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            return [_assessment_row(row) for row in rows]
     except sqlite3.Error as e:
         logger.error(f"Failed to retrieve all assessments: {e}")
         raise
 
+def get_indexable_assessments(db_connection=None) -> List[Dict[str, Any]]:
+    """
+    Retrieves the assessments that k-NN triage may vote on: final results only, without
+    provisional rows still queued for re-assessment or LLM responses that failed to parse.
+    """
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT a.*
+                FROM assessments a
+                LEFT JOIN reassessment_queue q ON q.assessment_id = a.id
+                WHERE q.assessment_id IS NULL AND a.score != 'Error'
+                ORDER BY a.created_at DESC
+                """
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to retrieve indexable assessments: {e}")
+        raise
+
 def update_assessment_with_override(assessment_id: int, human_override_score: str, human_override_triage: str, human_override_explanation: str, human_override_reason: str, db_connection=None):
-    """Updates an assessment with human override details."""
+    """Updates an assessment with human override details. Raises ValueError if the assessment does not exist."""
     conn = db_connection if db_connection else get_db_connection()
     try:
         with conn:
@@ -98,8 +148,230 @@ def update_assessment_with_override(assessment_id: int, human_override_score: st
                 """,
                 (human_override_score, human_override_triage, human_override_explanation, human_override_reason, assessment_id)
             )
+            if cursor.rowcount == 0:
+                raise ValueError(f"Assessment {assessment_id} does not exist.")
             conn.commit()
             logger.info(f"Updated assessment {assessment_id} with human override.")
     except sqlite3.Error as e:
         logger.error(f"Failed to update assessment {assessment_id} with override: {e}")
         raise
+
+def get_change_counter(table_name: str, db_connection=None) -> Optional[Dict[str, Any]]:
+    """Retrieves the change counter (version and last update time) for a table."""
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT table_name, version, updated_at FROM change_counters WHERE table_name = ?", (table_name,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Failed to retrieve change counter for {table_name}: {e}")
+        raise
+
+def enqueue_reassessment(assessment_id: int, reason: str, db_connection=None):
+    """Queues a provisional assessment for a full LLM re-assessment."""
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO reassessment_queue (assessment_id, reason) VALUES (?, ?)",
+                (assessment_id, reason)
+            )
+            logger.info(f"Queued assessment {assessment_id} for re-assessment ({reason}).")
+    except sqlite3.Error as e:
+        logger.error(f"Failed to queue assessment {assessment_id} for re-assessment: {e}")
+        raise
+
+def get_pending_reassessments(limit: int = 10, max_attempts: int = REASSESSMENT_MAX_ATTEMPTS, db_connection=None) -> List[Dict[str, Any]]:
+    """
+    Retrieves queued assessments with their engagement details, least attempted and then
+    oldest first, so an item that keeps failing does not block the rest of the queue.
+    Items that reached max_attempts are no longer retried but stay provisional.
+    """
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT q.assessment_id, q.reason, q.attempts, a.engagement_details, a.business_unit, a.engagement_category
+                FROM reassessment_queue q
+                JOIN assessments a ON a.id = q.assessment_id
+                WHERE q.attempts < ?
+                ORDER BY q.attempts, q.queued_at, q.assessment_id
+                LIMIT ?
+                """,
+                (max_attempts, limit)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to retrieve pending re-assessments: {e}")
+        raise
+
+def record_reassessment_attempt(assessment_id: int, db_connection=None):
+    """Increments the attempt counter of a queued re-assessment."""
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE reassessment_queue SET attempts = attempts + 1 WHERE assessment_id = ?",
+                (assessment_id,)
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to record re-assessment attempt for {assessment_id}: {e}")
+        raise
+
+def complete_reassessment(assessment_id: int, score: str, triage: str, explanation: str, db_connection=None):
+    """Replaces a provisional assessment with the full LLM result and removes it from the queue."""
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE assessments SET score = ?, triage = ?, explanation = ? WHERE id = ?",
+                (score, triage, explanation, assessment_id)
+            )
+            conn.execute("DELETE FROM reassessment_queue WHERE assessment_id = ?", (assessment_id,))
+            logger.info(f"Completed re-assessment of assessment {assessment_id}.")
+    except sqlite3.Error as e:
+        logger.error(f"Failed to complete re-assessment of assessment {assessment_id}: {e}")
+        raise
+
+def highlight_snippet(snippet: Optional[str]) -> Optional[str]:
+    """HTML-escapes an FTS snippet and turns its match markers into <mark> tags."""
+    if snippet is None:
+        return None
+    escaped = html.escape(snippet)
+    return escaped.replace(SNIPPET_MATCH_START, "<mark>").replace(SNIPPET_MATCH_END, "</mark>")
+
+def build_fts_query(query: str) -> str:
+    """
+    Turns free text into a safe FTS5 query: "quoted phrases" are kept as phrases,
+    every other word becomes its own quoted term, and all terms must match.
+    """
+    terms = []
+    for match in re.finditer(r'"([^"]+)"|(\S+)', query):
+        term = (match.group(1) or match.group(2)).strip().replace('"', '""')
+        if term:
+            terms.append(f'"{term}"')
+    return " ".join(terms)
+
+def search_assessments(query: str, limit: int = 20, offset: int = 0, db_connection=None) -> Dict[str, Any]:
+    """
+    Full-text searches assessments, returning the total number of matches and one page
+    of results ranked by bm25, each with a highlighted snippet.
+    """
+    fts_query = build_fts_query(query)
+    if not fts_query:
+        return {"total": 0, "results": []}
+
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM assessments_fts WHERE assessments_fts MATCH ?", (fts_query,))
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"""
+                SELECT a.*, {PROVISIONAL_COLUMN},
+                       snippet(assessments_fts, -1, ?, ?, '…', 16) AS snippet,
+                       -bm25(assessments_fts, {", ".join(str(w) for w in FTS_COLUMN_WEIGHTS)}) AS relevance
+                FROM assessments_fts
+                JOIN assessments a ON a.id = assessments_fts.rowid
+                WHERE assessments_fts MATCH ?
+                ORDER BY relevance DESC
+                LIMIT ? OFFSET ?
+                """,
+                (SNIPPET_MATCH_START, SNIPPET_MATCH_END, fts_query, limit, offset)
+            )
+            results = [_assessment_row(row) for row in cursor.fetchall()]
+            for result in results:
+                result["snippet"] = highlight_snippet(result["snippet"])
+            return {"total": total, "results": results}
+    except sqlite3.Error as e:
+        logger.error(f"Failed to search assessments: {e}", extra={"query": summarize_text(query)})
+        raise
+
+def get_assessments_by_ids(assessment_ids: List[int], db_connection=None) -> Dict[int, Dict[str, Any]]:
+    """Retrieves several assessments by ID, keyed by ID."""
+    if not assessment_ids:
+        return {}
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" for _ in assessment_ids)
+            cursor.execute(f"SELECT a.*, {PROVISIONAL_COLUMN} FROM assessments a WHERE a.id IN ({placeholders})", list(assessment_ids))
+            return {row['id']: _assessment_row(row) for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logger.error(f"Failed to retrieve assessments {assessment_ids}: {e}")
+        raise
+
+def _override_record(row: sqlite3.Row) -> Dict[str, Any]:
+    """Builds an override record (the OverrideRequest shape) from an assessment row."""
+    return {
+        "assessment_id": row["id"],
+        "business_unit": row["business_unit"],
+        "engagement_category": row["engagement_category"],
+        "original_engagement_details": row["engagement_details"],
+        "ai_assessment": {
+            "score": row["score"],
+            "triage": row["triage"],
+            "explanation": row["explanation"],
+        },
+        "human_override": {
+            "score": row["human_override_score"],
+            "triage": row["human_override_triage"],
+            "explanation": row["human_override_explanation"],
+            "reason": row["human_override_reason"],
+        },
+    }
+
+def get_override_records(assessment_ids: List[int], db_connection=None) -> Dict[int, Dict[str, Any]]:
+    """
+    Retrieves the override records of several assessments, keyed by assessment ID.
+    Assessments without a human override are omitted.
+    """
+    if not assessment_ids:
+        return {}
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" for _ in assessment_ids)
+            cursor.execute(
+                f"SELECT * FROM assessments WHERE id IN ({placeholders}) AND human_override_score IS NOT NULL",
+                list(assessment_ids)
+            )
+            return {row['id']: _override_record(row) for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        logger.error(f"Failed to retrieve override records {assessment_ids}: {e}")
+        raise
+
+def update_override_record(assessment_id: int, engagement_details: str, score: str, triage: str, explanation: str, human_override_score: str, human_override_triage: Optional[str], human_override_explanation: str, human_override_reason: str, db_connection=None):
+    """Updates the engagement text, AI assessment and human override of an overridden assessment."""
+    conn = db_connection if db_connection else get_db_connection()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE assessments
+                SET engagement_details = ?,
+                    score = ?,
+                    triage = ?,
+                    explanation = ?,
+                    human_override_score = ?,
+                    human_override_triage = ?,
+                    human_override_explanation = ?,
+                    human_override_reason = ?
+                WHERE id = ?
+                """,
+                (engagement_details, score, triage, explanation, human_override_score, human_override_triage, human_override_explanation, human_override_reason, assessment_id)
+            )
+            if cursor.rowcount == 0:
+                raise ValueError(f"Assessment {assessment_id} does not exist.")
+            logger.info(f"Updated override record of assessment {assessment_id}.")
+    except sqlite3.Error as e:
+        logger.error(f"Failed to update override record of assessment {assessment_id}: {e}")
+        raise
@@ -10,5 +10,91 @@ CREATE TABLE IF NOT EXISTS assessments (
     human_override_triage TEXT,
     human_override_explanation TEXT,
     human_override_reason TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    business_unit TEXT,
+    engagement_category TEXT
 );
+
+-- Change counters used to derive ETag/Last-Modified validators for list endpoints
+CREATE TABLE IF NOT EXISTS change_counters (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO change_counters (table_name) VALUES ('assessments');
+
+CREATE TRIGGER IF NOT EXISTS assessments_change_insert AFTER INSERT ON assessments
+BEGIN
+    UPDATE change_counters SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = 'assessments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS assessments_change_update AFTER UPDATE ON assessments
+BEGIN
+    UPDATE change_counters SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = 'assessments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS assessments_change_delete AFTER DELETE ON assessments
+BEGIN
+    UPDATE change_counters SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = 'assessments';
+END;
+
+-- Provisional (degraded-mode) assessments awaiting a full LLM re-assessment
+CREATE TABLE IF NOT EXISTS reassessment_queue (
+    assessment_id INTEGER PRIMARY KEY REFERENCES assessments(id) ON DELETE CASCADE,
+    reason TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Queue membership is exposed as the `provisional` flag of assessment rows
+CREATE TRIGGER IF NOT EXISTS reassessment_queue_change_insert AFTER INSERT ON reassessment_queue
+BEGIN
+    UPDATE change_counters SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = 'assessments';
+END;
+
+CREATE TRIGGER IF NOT EXISTS reassessment_queue_change_delete AFTER DELETE ON reassessment_queue
+BEGIN
+    UPDATE change_counters SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE table_name = 'assessments';
+END;
+
+-- Full-text search over assessment text (external-content FTS5 index on assessments)
+CREATE VIRTUAL TABLE IF NOT EXISTS assessments_fts USING fts5(
+    engagement_details,
+    explanation,
+    human_override_reason,
+    content='assessments',
+    content_rowid='id',
+    tokenize='porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS assessments_fts_insert AFTER INSERT ON assessments
+BEGIN
+    INSERT INTO assessments_fts (rowid, engagement_details, explanation, human_override_reason)
+    VALUES (new.id, new.engagement_details, new.explanation, new.human_override_reason);
+END;
+
+CREATE TRIGGER IF NOT EXISTS assessments_fts_delete AFTER DELETE ON assessments
+BEGIN
+    INSERT INTO assessments_fts (assessments_fts, rowid, engagement_details, explanation, human_override_reason)
+    VALUES ('delete', old.id, old.engagement_details, old.explanation, old.human_override_reason);
+END;
+
+CREATE TRIGGER IF NOT EXISTS assessments_fts_update AFTER UPDATE ON assessments
+BEGIN
+    INSERT INTO assessments_fts (assessments_fts, rowid, engagement_details, explanation, human_override_reason)
+    VALUES ('delete', old.id, old.engagement_details, old.explanation, old.human_override_reason);
+    INSERT INTO assessments_fts (rowid, engagement_details, explanation, human_override_reason)
+    VALUES (new.id, new.engagement_details, new.explanation, new.human_override_reason);
+END;
+
+-- One-off backfill of the FTS index for rows that existed before it was created
+CREATE TABLE IF NOT EXISTS completed_backfills (
+    name TEXT PRIMARY KEY,
+    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO assessments_fts (assessments_fts)
+SELECT 'rebuild' WHERE NOT EXISTS (SELECT 1 FROM completed_backfills WHERE name = 'assessments_fts');
+
+INSERT OR IGNORE INTO completed_backfills (name) VALUES ('assessments_fts');
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import List, Dict, Any, Optional
+
+from config import (
+    LLM_HEALTH_WINDOW, LLM_HEALTH_MIN_SAMPLES, LLM_LATENCY_SLO_SECONDS, LLM_ERROR_RATE_SLO,
+    DEGRADED_MODE_COOLDOWN_SECONDS, KNN_NEIGHBOURS, KNN_OVERRIDE_WEIGHT
+)
+from schemas import AssessmentResult
+
+logger = logging.getLogger(__name__)
+
+class LLMHealthMonitor:
+    """
+    Tracks recent LLM call latencies and errors, and decides whether the service
+    should answer in degraded (k-NN) mode.
+    """
+    def __init__(self):
+        self._samples = deque(maxlen=LLM_HEALTH_WINDOW)  # (latency_seconds, succeeded)
+        self._degraded_until = 0.0
+        self._lock = threading.Lock()
+        self.forced: Optional[bool] = None  # True/False overrides the automatic decision
+        self.last_trip_reason: Optional[str] = None
+
+    def record(self, latency: float, succeeded: bool):
+        """Records the outcome of an LLM call and trips degraded mode if an SLO is breached."""
+        with self._lock:
+            self._samples.append((latency, succeeded))
+            if len(self._samples) < LLM_HEALTH_MIN_SAMPLES:
+                return
+
+            error_rate = sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+            latencies = sorted(latency for latency, _ in self._samples)
+            p90_latency = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+
+            reason = None
+            if error_rate > LLM_ERROR_RATE_SLO:
+                reason = f"LLM error rate {error_rate:.0%} exceeds SLO of {LLM_ERROR_RATE_SLO:.0%}"
+            elif p90_latency > LLM_LATENCY_SLO_SECONDS:
+                reason = f"LLM p90 latency {p90_latency:.1f}s exceeds SLO of {LLM_LATENCY_SLO_SECONDS}s"
+
+            if reason:
+                logger.warning(f"Entering degraded mode for {DEGRADED_MODE_COOLDOWN_SECONDS}s: {reason}")
+                self._degraded_until = time.monotonic() + DEGRADED_MODE_COOLDOWN_SECONDS
+                self.last_trip_reason = reason
+                # Start afresh after the cooldown so a single probe can restore normal mode.
+                self._samples.clear()
+
+    def trip(self, reason: str):
+        """Enters degraded mode immediately, e.g. when the LLM client cannot be created."""
+        with self._lock:
+            logger.warning(f"Entering degraded mode for {DEGRADED_MODE_COOLDOWN_SECONDS}s: {reason}")
+            self._degraded_until = time.monotonic() + DEGRADED_MODE_COOLDOWN_SECONDS
+            self.last_trip_reason = reason
+            self._samples.clear()
+
+    def is_degraded(self) -> bool:
+        if self.forced is not None:
+            return self.forced
+        return time.monotonic() < self._degraded_until
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            remaining = max(0.0, self._degraded_until - time.monotonic())
+            return {
+                "degraded": self.is_degraded(),
+                "forced": self.forced,
+                "cooldown_remaining_seconds": round(remaining, 1),
+                "last_trip_reason": self.last_trip_reason,
+                "recent_calls": len(self._samples),
+                "recent_errors": sum(1 for _, ok in self._samples if not ok),
+            }
+
+# Singleton instance
+llm_health = LLMHealthMonitor()
+
+def _weighted_vote(decisions: List[Dict[str, Any]], key: str) -> tuple[str, float]:
+    """Returns the label with the highest total weight and its share of the total weight."""
+    votes = Counter()
+    for decision in decisions:
+        votes[decision[key]] += decision['weight']
+    label, weight = votes.most_common(1)[0]
+    return label, weight / sum(votes.values())
+
+def knn_triage(neighbours: List[Dict[str, Any]], reason: str) -> AssessmentResult:
+    """
+    Predicts score and triage from a distance-weighted vote over the nearest past
+    decisions, with human overrides weighted by KNN_OVERRIDE_WEIGHT.
+    The result is always flagged as provisional.
+    """
+    neighbours = neighbours[:KNN_NEIGHBOURS]
+    if not neighbours:
+        return AssessmentResult(
+            score="N/A",
+            triage="Senior Review",
+            explanation=(
+                f"**Provisional assessment** ({reason}). No past decisions were available for comparison, "
+                "so this engagement has been routed to Senior Review. A full assessment has been queued."
+            ),
+            provisional=True
+        )
+
+    for neighbour in neighbours:
+        base = KNN_OVERRIDE_WEIGHT if neighbour['is_override'] else 1.0
+        neighbour['weight'] = base / (neighbour['distance'] + 1e-6)
+
+    score, score_confidence = _weighted_vote(neighbours, 'score')
+    triage, triage_confidence = _weighted_vote(neighbours, 'triage')
+    overrides = sum(1 for n in neighbours if n['is_override'])
+
+    return AssessmentResult(
+        score=score,
+        triage=triage,
+        explanation=(
+            f"**Provisional assessment** ({reason}). This result was predicted from the {len(neighbours)} most similar "
+            f"past decisions ({overrides} human overrides), not from a full review against HMRC guidelines. "
+            f"Score confidence: {score_confidence:.0%}, triage confidence: {triage_confidence:.0%}. "
+            "A full assessment has been queued and will replace this result."
+        ),
+        provisional=True
+    )
@@ -0,0 +1,124 @@
+import gzip
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, List, Optional
+
+import orjson
+from fastapi import Request, Response
+
+from config import RESPONSE_COMPRESSION_MIN_SIZE, GZIP_COMPRESSION_LEVEL, BROTLI_COMPRESSION_QUALITY
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; fall back to gzip only.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+def make_etag(*parts: Any) -> str:
+    """Builds a weak ETag from the given version parts."""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def parse_db_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parses a SQLite CURRENT_TIMESTAMP value (UTC) into an aware datetime."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    except ValueError:
+        logger.warning(f"Could not parse database timestamp: {value}")
+        return None
+
+def latest_timestamp(*timestamps: Optional[datetime]) -> Optional[datetime]:
+    """Returns the most recent of several change timestamps, ignoring missing ones."""
+    present = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(present) if present else None
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluates the conditional GET headers of a request.
+    If-None-Match takes precedence over If-Modified-Since, as per RFC 9110.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the best supported content coding ('br' or 'gzip') from an Accept-Encoding header."""
+    supported = ["br", "gzip"] if brotli else ["gzip"]
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def _validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Returns an empty 304 response carrying the current validators."""
+    return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+
+def json_list_response(request: Request, content: List[Any], etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """
+    Serialises trusted rows with orjson (skipping response_model validation),
+    compresses the body according to Accept-Encoding and attaches cache validators.
+    """
+    body = orjson.dumps(content)
+    headers = _validator_headers(etag, last_modified)
+
+    encoding = None
+    if len(body) >= RESPONSE_COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_COMPRESSION_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_COMPRESSION_LEVEL)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,203 @@
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_PAYLOAD_PREVIEW_CHARS, LOG_DEBUG_SAMPLE_RATE
+
+# Loggers of this application (module names). Only these are lowered to DEBUG for
+# sampled requests; third-party libraries keep LOG_LEVEL.
+APP_LOGGERS = [
+    "__main__", "main", "assessment", "vector_store", "database", "data_loader",
+    "degraded_mode", "search", "http_utils", "replay_overrides",
+]
+
+# Attributes every LogRecord has; anything else was passed via `extra` and is logged as a field.
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+# Client-supplied request ids are only adopted if they match this; others are replaced.
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Per-request logging context: request id, debug sampling decision, timings and summary fields.
+_request_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_context", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def summarize_text(text: Optional[str]) -> str:
+    """
+    Describes a free-text payload without logging it: its length, a short hash
+    (to correlate log lines) and, if configured, a truncated preview.
+    """
+    if text is None:
+        return "<none>"
+    digest = hashlib.sha256(text.encode("utf-8", errors="replace")).hexdigest()[:12]
+    summary = f"<{len(text)} chars sha256:{digest}>"
+    if LOG_PAYLOAD_PREVIEW_CHARS > 0:
+        summary += f" {text[:LOG_PAYLOAD_PREVIEW_CHARS]!r}"
+    return summary
+
+class LazySummary:
+    """
+    Defers summarize_text until a record is actually formatted, for debug payloads
+    that are dropped by sampling most of the time. Pass it in `extra`.
+    """
+    __slots__ = ("text",)
+
+    def __init__(self, text: Optional[str]):
+        self.text = text
+
+    def __str__(self) -> str:
+        return summarize_text(self.text)
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """The fields passed to a log call via `extra`."""
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS and not key.startswith("_")}
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including `extra` fields."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Formats records as plain text lines, with `extra` fields appended as key=value pairs."""
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # Tracebacks are appended after this, so the fields stay on the message line.
+        fields = "".join(f" {key}={value}" for key, value in _extra_fields(record).items())
+        return super().formatMessage(record) + fields
+
+class RequestContextFilter(logging.Filter):
+    """Adds the request id to records and drops DEBUG records of requests that were not sampled."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get()
+        record.request_id = context["request_id"] if context else None
+        if record.levelno < logging.INFO:
+            return context["sampled"] if context else random.random() < LOG_DEBUG_SAMPLE_RATE
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records unformatted, so messages, `extra` payloads and tracebacks are
+    formatted by the listener thread rather than on the request path, and the
+    formatter still sees exc_info. The queue is in-process, so nothing is pickled.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+def _make_handlers() -> list:
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter()
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def _configure_root(handlers: list):
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    for handler in handlers:
+        handler.addFilter(RequestContextFilter())
+        root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    if LOG_DEBUG_SAMPLE_RATE > 0:
+        for name in APP_LOGGERS:
+            logging.getLogger(name).setLevel(logging.DEBUG)
+
+def setup_logging():
+    """
+    Configures logging for the whole process, once. Records are handed to a queue
+    by the calling thread and formatted and written by a background listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handlers = _make_handlers()
+    log_queue = queue.SimpleQueue()
+    _configure_root([DeferredQueueHandler(log_queue)])
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def setup_worker_logging():
+    """
+    Configures logging in a worker process (ProcessPoolExecutor initializer). The
+    parent's queue listener cannot be reached from another process, so records are
+    written directly, with the same format and destinations.
+    """
+    _configure_root(_make_handlers())
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def start_request_context(request_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Starts the logging context of a request, deciding whether its debug detail is sampled.
+    A client-supplied request id is kept only if it matches REQUEST_ID_PATTERN; otherwise
+    a new one is generated, so clients cannot inject arbitrary text into logs and headers.
+    """
+    if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex[:12]
+    context = {
+        "request_id": request_id,
+        "sampled": random.random() < LOG_DEBUG_SAMPLE_RATE,
+        "timings": {},
+        "fields": {},
+    }
+    context["token"] = _request_context.set(context)
+    return context
+
+def end_request_context(context: Dict[str, Any]):
+    _request_context.reset(context["token"])
+
+def annotate(**fields):
+    """Adds fields to the current request's summary line."""
+    context = _request_context.get()
+    if context is not None:
+        context["fields"].update(fields)
+
+@contextmanager
+def timed(name: str):
+    """Records the duration of a block, in milliseconds, on the current request's summary line."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        context = _request_context.get()
+        if context is not None:
+            elapsed = (time.perf_counter() - start) * 1000
+            context["timings"][name] = round(context["timings"].get(name, 0.0) + elapsed, 1)
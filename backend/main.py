@@ -1,24 +1,47 @@
+import asyncio
+import os
 import logging
-from fastapi import FastAPI, HTTPException
+import time
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from typing import List
+from typing import List, Optional
 
 import config
+from logging_config import setup_logging, shutdown_logging, start_request_context, end_request_context, timed
+
+# Set up logging once, before the modules below log during import.
+setup_logging()
+
 from data_loader import load_all_guidelines
-from vector_store import vector_store, get_all_overrides, update_override, delete_override
-from assessment import assess_engagement
-from schemas import AssessmentRequest, AssessmentResponse, OverrideRequest, AssessmentResult, AssessmentRecord, UpdateOverrideRequest
-from database import save_assessment, get_all_assessments, update_assessment_with_override
+from vector_store import vector_store, get_all_overrides, update_override, delete_override, get_override_partitions
+from assessment import assess_engagement, reassess_pending
+from degraded_mode import llm_health
+from schemas import AssessmentRequest, AssessmentResponse, OverrideRequest, AssessmentResult, AssessmentRecord, UpdateOverrideRequest, DegradedModeRequest, AssessmentSearchResponse, OverridePartition
+from database import create_database, save_assessment, get_all_assessments, get_indexable_assessments, update_assessment_with_override, get_change_counter, enqueue_reassessment
+from search import search
+from http_utils import make_etag, latest_timestamp, parse_db_timestamp, is_not_modified, not_modified_response, json_list_response
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def reassessment_worker():
+    """Periodically replaces provisional assessments with full LLM assessments."""
+    while True:
+        await asyncio.sleep(config.REASSESSMENT_INTERVAL_SECONDS)
+        if llm_health.is_degraded():
+            continue
+        try:
+            await reassess_pending()
+        except Exception as e:
+            logger.error(f"An error occurred while re-assessing provisional assessments: {e}", exc_info=True)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code to run on server startup
     logger.info("Server starting up...")
+
+    # Apply the DDL (idempotent) so tables, triggers and change counters exist.
+    create_database()
     logger.info("Loading HMRC guidelines and populating vector store...")
     
     # 1. Load guidelines from URLs
@@ -29,11 +52,26 @@ async def lifespan(app: FastAPI):
         vector_store.populate_hmrc_guidelines(hmrc_chunks)
     else:
         logger.error("No HMRC guidelines were loaded. The assessment API may not function correctly.")
+
+    # 3. Index past assessments for degraded-mode k-NN triage
+    vector_store.backfill_assessments(get_indexable_assessments())
+
+    # 4. Compact legacy override records, or warm-start an empty store from a snapshot
+    vector_store.compact_legacy_overrides()
+    if not any(c.count() for c in vector_store.override_partitions.values()) and os.path.exists(config.OVERRIDE_SNAPSHOT_PATH + ".json"):
+        try:
+            vector_store.restore_overrides()
+        except Exception as e:
+            logger.error(f"Could not restore overrides from snapshot: {e}")
+
+    worker = asyncio.create_task(reassessment_worker())
     
     logger.info("Startup process complete.")
     yield
     # Code to run on server shutdown
     logger.info("Server shutting down...")
+    worker.cancel()
+    shutdown_logging()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -46,6 +84,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_logging_middleware(request: Request, call_next):
+    """Logs one summary line per request, with timings and fields collected while handling it."""
+    context = start_request_context(request.headers.get("x-request-id"))
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = context["request_id"]
+        return response
+    finally:
+        logger.info(
+            "Request completed",
+            extra={
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "timings": context["timings"],
+                **context["fields"],
+            }
+        )
+        end_request_context(context)
+
 @app.get("/")
 def read_root():
     return {"message": "HMRC Assessment API is running."}
@@ -62,12 +125,25 @@ async def assess_endpoint(request: AssessmentRequest):
         )
     try:
         assessment_result, similar_assessment = await assess_engagement(request)
-        assessment_id = save_assessment(
-            engagement_details=request.engagement_details,
-            score=assessment_result.score,
-            triage=assessment_result.triage,
-            explanation=assessment_result.explanation
-        )
+        with timed("db_ms"):
+            assessment_id = save_assessment(
+                engagement_details=request.engagement_details,
+                score=assessment_result.score,
+                triage=assessment_result.triage,
+                explanation=assessment_result.explanation,
+                business_unit=request.business_unit,
+                engagement_category=request.engagement_category
+            )
+        if assessment_result.provisional:
+            enqueue_reassessment(assessment_id, reason="provisional k-NN triage")
+        elif assessment_result.score != "Error":
+            try:
+                vector_store.add_assessment(
+                    assessment_id, request.engagement_details, assessment_result.score, assessment_result.triage,
+                    request.business_unit, request.engagement_category
+                )
+            except Exception as e:
+                logger.warning(f"Could not index assessment {assessment_id} for k-NN triage: {e}")
         return AssessmentResponse(
             assessment=assessment_result,
             assessment_id=assessment_id,
@@ -83,10 +159,7 @@ def override_endpoint(request: OverrideRequest):
     Receives a human override and stores it for in-session learning and database update.
     """
     try:
-        # For in-session learning
-        vector_store.add_override(request)
-        
-        # Update the database record
+        # Update the database record first: it holds the override text the vector store refers to
         update_assessment_with_override(
             assessment_id=request.assessment_id,
             human_override_score=request.human_override.score,
@@ -94,55 +167,149 @@ def override_endpoint(request: OverrideRequest):
             human_override_explanation=request.human_override.explanation,
             human_override_reason=request.human_override.reason
         )
+    except ValueError:
+        # Nothing was written, so no vector can be left pointing at a missing assessment.
+        raise HTTPException(status_code=404, detail=f"Assessment {request.assessment_id} was not found.")
+    except Exception as e:
+        logger.error(f"An error occurred while storing the override: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while storing the override.")
+
+    try:
+        # For in-session learning
+        vector_store.add_override(request)
         return {"message": "Override received and stored successfully."}
     except Exception as e:
         logger.error(f"An error occurred while storing the override: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred while storing the override.")
 
 @app.get("/assessments", response_model=List[AssessmentRecord])
-def get_assessments_endpoint():
+def get_assessments_endpoint(request: Request):
     """
     Returns all historical assessments.
+    Supports conditional GET via ETag/Last-Modified derived from the table change counter.
     """
     try:
+        counter = get_change_counter("assessments") or {"version": 0, "updated_at": None}
+        etag = make_etag("assessments", counter["version"])
+        last_modified = parse_db_timestamp(counter["updated_at"])
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
         assessments = get_all_assessments()
-        return assessments
+        return json_list_response(request, assessments, etag, last_modified)
     except Exception as e:
         logger.error(f"An error occurred while fetching assessments: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred while fetching assessments.")
 
+@app.get("/assessments/search", response_model=AssessmentSearchResponse)
+def search_assessments_endpoint(
+    q: str = Query(..., min_length=1, description="Search text. Use double quotes for exact phrases."),
+    limit: int = Query(20, ge=1, le=config.SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    semantic: bool = Query(False, description="Also merge in assessments behind similar human overrides."),
+):
+    """
+    Full-text searches historical assessments, returning ranked, highlighted, paginated results.
+    """
+    try:
+        return search(q, limit=limit, offset=offset, semantic=semantic)
+    except Exception as e:
+        logger.error(f"An error occurred while searching assessments: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while searching assessments.")
+
 @app.get("/overrides", response_model=List[OverrideRequest])
-def get_overrides_endpoint():
+def get_overrides_endpoint(request: Request, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
     """
-    Returns all override records.
+    Returns all override records, or those of one partition when partition keys are given.
+    Supports conditional GET via ETag/Last-Modified derived from the collection and assessments change counters.
     """
     try:
-        overrides = get_all_overrides()
-        return overrides
+        # Override text lives in the assessments table, so its version is part of both validators.
+        counter = get_change_counter("assessments") or {"version": 0, "updated_at": None}
+        etag = make_etag("overrides", vector_store.instance_id, vector_store.override_version, counter["version"])
+        last_modified = latest_timestamp(vector_store.override_updated_at, parse_db_timestamp(counter["updated_at"]))
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        overrides = get_all_overrides(business_unit, engagement_category)
+        return json_list_response(request, overrides, etag, last_modified)
     except Exception as e:
         logger.error(f"An error occurred while fetching overrides: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred while fetching overrides.")
 
+@app.get("/overrides/partitions", response_model=List[OverridePartition])
+def get_override_partitions_endpoint():
+    """
+    Returns the override partitions and their record counts.
+    """
+    try:
+        return get_override_partitions()
+    except Exception as e:
+        logger.error(f"An error occurred while fetching override partitions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while fetching override partitions.")
+
 @app.put("/overrides/{override_id}")
-def update_override_endpoint(override_id: str, request: UpdateOverrideRequest):
+def update_override_endpoint(override_id: str, request: UpdateOverrideRequest, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
     """
-    Updates a specific override record.
+    Updates a specific override record. Partition keys are optional; without them the
+    override is located across all partitions.
     """
     try:
-        update_override(override_id, request.dict())
+        update_override(override_id, request.dict(), business_unit, engagement_category)
         return {"message": f"Override {override_id} updated successfully."}
     except Exception as e:
         logger.error(f"An error occurred while updating override {override_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An internal error occurred while updating override {override_id}.")
 
 @app.delete("/overrides/{override_id}")
-def delete_override_endpoint(override_id: str):
+def delete_override_endpoint(override_id: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
     """
-    Deletes a specific override record.
+    Deletes a specific override record. Partition keys are optional; without them the
+    override is located across all partitions.
     """
     try:
-        delete_override(override_id)
+        delete_override(override_id, business_unit, engagement_category)
         return {"message": f"Override {override_id} deleted successfully."}
     except Exception as e:
         logger.error(f"An error occurred while deleting override {override_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An internal error occurred while deleting override {override_id}.")
+
+@app.post("/overrides/snapshot")
+def snapshot_overrides_endpoint():
+    """
+    Writes all override embeddings to the configured snapshot file.
+    """
+    try:
+        return vector_store.snapshot_overrides()
+    except Exception as e:
+        logger.error(f"An error occurred while writing the override snapshot: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while writing the override snapshot.")
+
+@app.post("/overrides/restore")
+def restore_overrides_endpoint():
+    """
+    Loads override embeddings from the configured snapshot file.
+    """
+    try:
+        return vector_store.restore_overrides()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No override snapshot was found.")
+    except Exception as e:
+        logger.error(f"An error occurred while restoring overrides: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal error occurred while restoring overrides.")
+
+@app.get("/degraded-mode")
+def get_degraded_mode_endpoint():
+    """
+    Returns the current degraded-mode status and LLM health.
+    """
+    return llm_health.status()
+
+@app.put("/degraded-mode")
+def set_degraded_mode_endpoint(request: DegradedModeRequest):
+    """
+    Forces degraded mode on or off, or restores automatic switching when `forced` is null.
+    """
+    llm_health.forced = request.forced
+    logger.info(f"Degraded mode forced state set to: {request.forced}")
+    return llm_health.status()
@@ -0,0 +1,66 @@
+"""
+Override partition naming and matching rules.
+
+Kept free of heavy imports so offline tools (e.g. replay_overrides.py) can apply
+exactly the same rules as the service without loading the vector store.
+"""
+import re
+from typing import Optional
+
+from config import OVERRIDE_COLLECTION_NAME
+
+PARTITION_SEPARATOR = "__"
+# Slot name used when a partition key is not given. In lookups a missing key matches
+# every value of that key instead (see partition_matches).
+PARTITION_UNSPECIFIED = "any"
+# A key whose slug is the reserved slot name is stored under this escaped slug instead.
+# Slugs never contain "_", so it cannot collide with another key.
+PARTITION_RESERVED_ESCAPE = "_" + PARTITION_UNSPECIFIED
+PARTITION_SLUG_MAX_LENGTH = 60
+
+def partition_slug(value: Optional[str]) -> str:
+    """
+    Normalises a partition key for use in collection names and metadata filters.
+    Slugs are lowercase alphanumeric runs joined by single hyphens, never starting or
+    ending with one (ChromaDB requires collection names to end alphanumerically).
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", value.lower())[:PARTITION_SLUG_MAX_LENGTH].strip("-") if value else ""
+    if slug == PARTITION_UNSPECIFIED:
+        return PARTITION_RESERVED_ESCAPE
+    return slug or PARTITION_UNSPECIFIED
+
+def override_partition_name(business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> str:
+    """
+    Returns the override collection name for a partition. Keys are case-insensitive.
+    Overrides without partition keys live in the original OVERRIDE_COLLECTION_NAME collection.
+    """
+    if not business_unit and not engagement_category:
+        return OVERRIDE_COLLECTION_NAME
+    return PARTITION_SEPARATOR.join([OVERRIDE_COLLECTION_NAME, partition_slug(business_unit), partition_slug(engagement_category)])
+
+def partition_matches(name: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> bool:
+    """
+    Whether an override collection serves a lookup. Given keys must match; a missing key
+    matches any value, so a business unit alone matches all of that unit's categories.
+    Without keys only the unpartitioned collection matches.
+    """
+    if not business_unit and not engagement_category:
+        return name == OVERRIDE_COLLECTION_NAME
+    parts = name.split(PARTITION_SEPARATOR)
+    if len(parts) != 3 or parts[0] != OVERRIDE_COLLECTION_NAME:
+        return False
+    return (
+        (not business_unit or parts[1] == partition_slug(business_unit))
+        and (not engagement_category or parts[2] == partition_slug(engagement_category))
+    )
+
+def assessment_partition_filter(business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> Optional[dict]:
+    """Chroma `where` filter restricting assessment history to a partition, with the same wildcard rules."""
+    conditions = [
+        {key: partition_slug(value)}
+        for key, value in (("business_unit", business_unit), ("engagement_category", engagement_category))
+        if value
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
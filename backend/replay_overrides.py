@@ -0,0 +1,179 @@
+"""
+Offline replay harness for calibrating the override similarity threshold.
+
+Replays the stored assessments through the embedding and override-lookup
+pipeline with leave-one-out (a record never matches its own override) and
+without calling the LLM. For each distance metric and threshold it reports:
+  - hit rate: share of assessments that would have reused a human override
+  - agreement: share of hits on overridden records whose reused score/triage
+    matches the record's own human override (human ground truth)
+  - AI agreement: reported separately, for hits on records without an
+    override, against the AI result they kept
+  - LLM calls and latency saved, using an estimated per-call LLM latency
+
+With --partitioned, a record only matches the overrides its own business unit
+and engagement category would be looked up in, with the service's rules (see
+partitions.py): keys are compared as slugs and a missing key matches any value.
+Global fallback is not replayed.
+
+Usage:
+    python replay_overrides.py --thresholds 0.2 0.3 0.4 0.5 0.6 --llm-latency 12
+"""
+import argparse
+import json
+import logging
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from config import EMBEDDING_MODEL_NAME, OVERRIDE_SIMILARITY_THRESHOLD
+from database import DB_FILE, get_db_connection, get_all_assessments
+from partitions import override_partition_name, partition_matches
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Distance metrics mirror ChromaDB's "hnsw:space" options, so thresholds
+# found here can be used directly against a collection of the same space.
+METRICS = ["l2", "cosine", "ip"]
+DEFAULT_THRESHOLDS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0]
+
+def pairwise_distances(embeddings: np.ndarray, metric: str) -> np.ndarray:
+    """Computes the full distance matrix between embeddings, as ChromaDB would report it."""
+    dots = embeddings @ embeddings.T
+    if metric == "l2":
+        # ChromaDB reports squared L2 distance.
+        norms = np.einsum("ij,ij->i", embeddings, embeddings)
+        return np.maximum(norms[:, None] + norms[None, :] - 2 * dots, 0.0)
+    if metric == "cosine":
+        norms = np.linalg.norm(embeddings, axis=1)
+        norms[norms == 0] = 1.0
+        return 1.0 - dots / (norms[:, None] * norms[None, :])
+    if metric == "ip":
+        return 1.0 - dots
+    raise ValueError(f"Unsupported distance metric: {metric}")
+
+def same_partition(records: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Boolean matrix whose [i, j] entry says whether a lookup with record i's partition keys
+    searches the partition an override on record j is stored in. Not symmetric: a lookup
+    by business unit alone also searches that unit's categorised partitions.
+    """
+    keys = [(r.get("business_unit"), r.get("engagement_category")) for r in records]
+    # Evaluate the rules once per distinct pair of keys rather than per pair of records.
+    distinct = {key: code for code, key in enumerate(dict.fromkeys(keys))}
+    allowed = np.array([
+        [partition_matches(override_partition_name(*stored), *query) for stored in distinct]
+        for query in distinct
+    ], dtype=bool)
+    codes = np.array([distinct[key] for key in keys])
+    return allowed[codes[:, None], codes[None, :]]
+
+def nearest_overrides(distances: np.ndarray, override_mask: np.ndarray, partition_mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    For every record, finds the nearest *other* record that carries a human override,
+    optionally only among the pairs allowed by partition_mask.
+    Returns the neighbour indices and distances (-1 / inf when there is no candidate).
+    """
+    candidates = override_mask[None, :] if partition_mask is None else override_mask[None, :] & partition_mask
+    masked = np.where(candidates, distances, np.inf)
+    np.fill_diagonal(masked, np.inf)  # leave-one-out
+    neighbours = np.argmin(masked, axis=1)
+    nearest = masked[np.arange(len(masked)), neighbours]
+    neighbours[np.isinf(nearest)] = -1
+    return neighbours, nearest
+
+def _agreement(records: List[Dict[str, Any]], neighbours: np.ndarray, hits: List[int], score_key: str, triage_key: str) -> tuple[int, int]:
+    """Counts hits whose reused score and triage match the given fields of the queried record."""
+    score_agree = sum(1 for i in hits if records[neighbours[i]]["human_override_score"] == records[i][score_key])
+    triage_agree = sum(
+        1 for i in hits if (records[neighbours[i]].get("human_override_triage") or "N/A") == (records[i].get(triage_key) or "N/A")
+    )
+    return score_agree, triage_agree
+
+def replay(records: List[Dict[str, Any]], embeddings: np.ndarray, metrics: List[str], thresholds: List[float], llm_latency: float, partitioned: bool = False) -> List[Dict[str, Any]]:
+    """Runs the leave-one-out sweep and returns one report row per (metric, threshold)."""
+    total = len(records)
+    override_mask = np.array([bool(r.get("human_override_score")) for r in records])
+    partition_mask = same_partition(records) if partitioned else None
+
+    report = []
+    for metric in metrics:
+        neighbours, nearest = nearest_overrides(pairwise_distances(embeddings, metric), override_mask, partition_mask)
+        for threshold in thresholds:
+            hits = [i for i in range(total) if neighbours[i] >= 0 and nearest[i] < threshold]
+            # Agreement is measured against human decisions only; hits on records
+            # that kept their AI result are reported separately.
+            human_hits = [i for i in hits if override_mask[i]]
+            ai_hits = [i for i in hits if not override_mask[i]]
+            score_agree, triage_agree = _agreement(records, neighbours, human_hits, "human_override_score", "human_override_triage")
+            ai_score_agree, _ = _agreement(records, neighbours, ai_hits, "score", "triage")
+            report.append({
+                "metric": metric,
+                "threshold": threshold,
+                "queries": total,
+                "hits": len(hits),
+                "hit_rate": len(hits) / total if total else 0.0,
+                "human_hits": len(human_hits),
+                "score_agreement": score_agree / len(human_hits) if human_hits else None,
+                "triage_agreement": triage_agree / len(human_hits) if human_hits else None,
+                "wrong_reuses": len(human_hits) - score_agree,
+                "ai_hits": len(ai_hits),
+                "ai_score_agreement": ai_score_agree / len(ai_hits) if ai_hits else None,
+                "llm_calls_saved": len(hits),
+                "latency_saved_s": len(hits) * llm_latency,
+            })
+    return report
+
+def _format_ratio(value: float | None) -> str:
+    return "-" if value is None else f"{value:6.1%}"
+
+def print_report(report: List[Dict[str, Any]]):
+    header = (
+        f"{'metric':<7} {'thresh':>6} {'hits':>5} {'hit rate':>8} {'human':>5} {'score ok':>8} {'triage ok':>9} "
+        f"{'wrong':>5} {'ai':>5} {'ai ok':>6} {'saved (s)':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in report:
+        print(
+            f"{row['metric']:<7} {row['threshold']:>6.2f} {row['hits']:>5} {_format_ratio(row['hit_rate']):>8} "
+            f"{row['human_hits']:>5} {_format_ratio(row['score_agreement']):>8} {_format_ratio(row['triage_agreement']):>9} "
+            f"{row['wrong_reuses']:>5} {row['ai_hits']:>5} {_format_ratio(row['ai_score_agreement']):>6} {row['latency_saved_s']:>9.1f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay stored assessments to calibrate the override similarity threshold.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the assessments SQLite database.")
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=METRICS, help="Distance metrics to sweep.")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=DEFAULT_THRESHOLDS, help="Distance thresholds to sweep.")
+    parser.add_argument("--llm-latency", type=float, default=10.0, help="Estimated seconds per Bedrock call.")
+    parser.add_argument("--partitioned", action="store_true", help="Only match overrides within the same business unit and engagement category.")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+    setup_logging()
+
+    thresholds = sorted(set(args.thresholds) | {OVERRIDE_SIMILARITY_THRESHOLD})
+    records = get_all_assessments(get_db_connection(args.db))
+    overrides = sum(1 for r in records if r.get("human_override_score"))
+    logger.info(f"Loaded {len(records)} assessments ({overrides} with human overrides) from {args.db}")
+    if not records or not overrides:
+        logger.warning("Nothing to replay: at least one assessment with a human override is required.")
+        return
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode([r["engagement_details"] for r in records]), dtype=np.float32)
+    logger.info(f"Encoded {len(records)} engagements in {time.perf_counter() - start:.2f}s")
+
+    report = replay(records, embeddings, args.metrics, thresholds, args.llm_latency, args.partitioned)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Current OVERRIDE_SIMILARITY_THRESHOLD: {OVERRIDE_SIMILARITY_THRESHOLD}")
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
+class GuidelineChunk(BaseModel):
+    text: str
+    source_url: str
+    heading_path: List[str] = []
+
 class AssessmentRequest(BaseModel):
     engagement_details: str
+    # Optional partition keys; overrides are stored and searched per partition.
+    business_unit: Optional[str] = None
+    engagement_category: Optional[str] = None
+    global_fallback: Optional[bool] = None  # Defaults to config.OVERRIDE_GLOBAL_FALLBACK
+    fast_triage: bool = False  # Request a provisional k-NN triage instead of a full LLM assessment
 
 class AssessmentResult(BaseModel):
     score: str
     triage: str
     explanation: str
+    provisional: bool = False
 
 class HumanOverride(BaseModel):
     score: str
@@ -22,6 +33,8 @@ class OverrideRequest(BaseModel):
     original_engagement_details: str
     ai_assessment: AssessmentResult
     human_override: HumanOverride
+    business_unit: Optional[str] = None
+    engagement_category: Optional[str] = None
 
 
 class AssessmentResponse(BaseModel):
@@ -40,8 +53,32 @@ class AssessmentRecord(BaseModel):
     human_override_explanation: Optional[str] = None
     human_override_reason: Optional[str] = None
     created_at: str
+    business_unit: Optional[str] = None
+    engagement_category: Optional[str] = None
+    provisional: bool = False  # A k-NN result still queued for a full re-assessment
+
+class AssessmentSearchHit(AssessmentRecord):
+    snippet: Optional[str] = None  # HTML-escaped, matches highlighted with <mark> tags
+    relevance: float
+    match: str  # "lexical", "semantic" or "both"
+
+class AssessmentSearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[AssessmentSearchHit]
 
 class UpdateOverrideRequest(BaseModel):
     original_engagement_details: str
     ai_assessment: AssessmentResult
     human_override: HumanOverride
+
+class DegradedModeRequest(BaseModel):
+    forced: Optional[bool] = None  # None restores automatic SLO-based switching
+
+class OverridePartition(BaseModel):
+    name: str
+    business_unit: Optional[str] = None
+    engagement_category: Optional[str] = None
+    count: int
@@ -0,0 +1,54 @@
+import logging
+from typing import Dict, Any
+
+from config import SEARCH_RRF_K, SEARCH_MAX_VECTOR_DISTANCE
+from database import search_assessments, get_assessments_by_ids
+from vector_store import vector_store
+from logging_config import LazySummary
+
+logger = logging.getLogger(__name__)
+
+def search(query: str, limit: int = 20, offset: int = 0, semantic: bool = False) -> Dict[str, Any]:
+    """
+    Searches assessment history with the FTS5 index.
+    With `semantic`, lexical hits are merged with the assessments behind the most
+    similar human overrides using reciprocal rank fusion. In that case `total` counts
+    all lexical matches plus the vector-only hits within the fused window.
+    """
+    if not semantic:
+        page = search_assessments(query, limit=limit, offset=offset)
+        for hit in page["results"]:
+            hit["match"] = "lexical"
+        return {"query": query, "total": page["total"], "limit": limit, "offset": offset, "results": page["results"]}
+
+    window = offset + limit
+    lexical = search_assessments(query, limit=window, offset=0)
+    vector_hits = [
+        (assessment_id, distance)
+        for assessment_id, distance in vector_store.find_similar_override_assessments(query, n_results=window)
+        if distance <= SEARCH_MAX_VECTOR_DISTANCE
+    ]
+    logger.debug(
+        "Search: %d lexical hits, %d vector hits.", len(lexical['results']), len(vector_hits),
+        extra={"query": LazySummary(query)}
+    )
+
+    hits = {hit["id"]: dict(hit, match="lexical", relevance=0.0) for hit in lexical["results"]}
+    scores = {}
+    for rank, hit in enumerate(lexical["results"]):
+        scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (SEARCH_RRF_K + rank + 1)
+    for rank, (assessment_id, _) in enumerate(vector_hits):
+        scores[assessment_id] = scores.get(assessment_id, 0.0) + 1.0 / (SEARCH_RRF_K + rank + 1)
+        if assessment_id in hits:
+            hits[assessment_id]["match"] = "both"
+
+    vector_only = [assessment_id for assessment_id, _ in vector_hits if assessment_id not in hits]
+    for assessment_id, record in get_assessments_by_ids(vector_only).items():
+        hits[assessment_id] = dict(record, match="semantic", snippet=None)
+
+    ranked = sorted((hits[i] for i in scores if i in hits), key=lambda hit: scores[hit["id"]], reverse=True)
+    for hit in ranked:
+        hit["relevance"] = scores[hit["id"]]
+
+    total = lexical["total"] + sum(1 for hit in ranked if hit["match"] == "semantic")
+    return {"query": query, "total": total, "limit": limit, "offset": offset, "results": ranked[offset:offset + limit]}
@@ -0,0 +1,77 @@
+import os
+
+from data_loader import make_soup, extract_sections, chunk_section, _split_long_segment, process_guideline_html, process_pages, count_tokens
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "guidelines")
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+def words(prefix: str, count: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+def test_extract_sections_follows_heading_structure():
+    html = read_fixture("off-payroll-working-for-agencies.html")
+    sections = extract_sections(make_soup(html))
+    paths = [path for path, _ in sections]
+
+    assert paths[0] == []  # Introduction before the first h2
+    assert ["If you are the fee-payer"] in paths
+    assert ["If you are the fee-payer", "Working out the deemed direct payment"] in paths
+    assert ["If you are the fee-payer", "Keeping records"] in paths
+    # An h2 resets the h3 below it.
+    assert ["If you are not the fee-payer"] in paths
+    assert ["Transfer of liability", "Offshore agencies"] in paths
+
+    segments = dict((tuple(path), segments) for path, segments in sections)
+    assert len(segments[("If you are the fee-payer", "Working out the deemed direct payment")]) == 2
+
+def test_extract_sections_does_not_duplicate_nested_text():
+    html = "<body><h2>Lists</h2><ul><li>Outer <ul><li>inner</li></ul></li></ul><p></p><h2>Empty</h2></body>"
+    assert extract_sections(make_soup(html, "html.parser")) == [(["Lists"], ["Outer inner"])]
+
+def test_split_long_segment_respects_limit_and_overlap():
+    pieces = _split_long_segment(words("w", 25), max_tokens=10, overlap_tokens=3, counter=word_count)
+
+    assert all(word_count(piece) <= 10 for piece in pieces)
+    for previous, piece in zip(pieces, pieces[1:]):
+        assert piece.split()[:3] == previous.split()[-3:]
+    # Every word is kept, in order.
+    seen = pieces[0].split() + [word for piece in pieces[1:] for word in piece.split()[3:]]
+    assert seen == words("w", 25).split()
+
+def test_chunk_section_packs_segments_with_overlap():
+    segments = [words("a", 4), words("b", 4), words("c", 4)]
+    chunks = chunk_section(segments, max_tokens=10, overlap_tokens=2, counter=word_count)
+
+    assert chunks == [f"{segments[0]} {segments[1]}", f"b2 b3 {segments[2]}"]
+    assert chunk_section([], max_tokens=10, overlap_tokens=2, counter=word_count) == []
+
+def test_chunk_section_overlaps_into_long_segment():
+    segments = [words("a", 4), words("long", 25)]
+    chunks = chunk_section(segments, max_tokens=10, overlap_tokens=2, counter=word_count)
+
+    assert chunks[0] == segments[0]
+    assert chunks[1].startswith("a2 a3 long0")
+    assert all(word_count(chunk) <= 10 for chunk in chunks)
+
+def test_process_guideline_html_prefixes_headings_within_limit():
+    html = read_fixture("understanding-off-payroll-working-ir35.html")
+    chunks = process_guideline_html(html, "https://example.gov.uk/ir35", max_tokens=60, overlap_tokens=10)
+
+    assert chunks
+    for chunk in chunks:
+        assert chunk.source_url == "https://example.gov.uk/ir35"
+        assert count_tokens(chunk.text) <= 60
+        if chunk.heading_path:
+            assert chunk.text.startswith(" > ".join(chunk.heading_path) + "\n")
+
+def test_process_pages_in_worker_processes():
+    pages = [(name, read_fixture(name)) for name in sorted(os.listdir(FIXTURES_DIR))]
+    sequential = process_pages(pages, workers=1)
+    parallel = process_pages(pages, workers=2)
+    assert [chunk.text for chunk in parallel] == [chunk.text for chunk in sequential]
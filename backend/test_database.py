@@ -1,8 +1,14 @@
+import os
 import pytest
 import sqlite3
 import time
 from unittest.mock import patch, mock_open
-from database import create_database, save_assessment, get_assessment, get_all_assessments, update_assessment_with_override
+import database
+from database import (
+    create_database, save_assessment, get_assessment, get_all_assessments, update_assessment_with_override, get_change_counter,
+    get_indexable_assessments, enqueue_reassessment, get_pending_reassessments, record_reassessment_attempt, complete_reassessment,
+    build_fts_query, highlight_snippet, search_assessments, get_assessments_by_ids, get_override_records, update_override_record
+)
 
 # Sample DDL for testing purposes
 SAMPLE_DDL = """
@@ -16,7 +22,16 @@ CREATE TABLE assessments (
     human_override_triage TEXT,
     human_override_explanation TEXT,
     human_override_reason TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    business_unit TEXT,
+    engagement_category TEXT
+);
+
+CREATE TABLE reassessment_queue (
+    assessment_id INTEGER PRIMARY KEY REFERENCES assessments(id) ON DELETE CASCADE,
+    reason TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 """
 
@@ -29,6 +44,20 @@ def db_connection():
     yield conn
     conn.close()
 
+def read_ddl_script():
+    with open(os.path.join(os.path.dirname(__file__), "database_setup.sql"), 'r') as f:
+        return f.read()
+
+@pytest.fixture
+def ddl_db_connection():
+    """Fixture to set up an in-memory SQLite database from the real DDL script."""
+    ddl_script = read_ddl_script()
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(ddl_script)
+    yield conn
+    conn.close()
+
 def test_create_database(db_connection):
     """Test that the database and table are created successfully."""
     # We are not actually calling create_database() with a file, 
@@ -39,6 +68,30 @@ def test_create_database(db_connection):
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='assessments'")
     assert cursor.fetchone() is not None
 
+def test_create_database_adds_partition_columns(tmp_path, monkeypatch):
+    """Test that create_database adds the partition key columns to an existing database."""
+    db_file = tmp_path / "assessments.db"
+    conn = sqlite3.connect(db_file)
+    conn.executescript(SAMPLE_DDL.replace("    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\n    business_unit TEXT,\n    engagement_category TEXT\n", "    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP\n"))
+    conn.close()
+
+    def connect(*args):
+        connection = sqlite3.connect(db_file)
+        connection.row_factory = sqlite3.Row
+        return connection
+    monkeypatch.setattr(database, "get_db_connection", connect)
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    create_database()
+    create_database()  # Idempotent
+
+    conn = connect()
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(assessments)")}
+    assert {"business_unit", "engagement_category"} <= columns
+    assessment_id = save_assessment("Engagement", "Low Risk", "Auto-approve", "Fine.", conn, "HR", "Contractors")
+    saved = get_assessment(assessment_id, conn)
+    assert (saved['business_unit'], saved['engagement_category']) == ("HR", "Contractors")
+    conn.close()
+
 def test_save_and_get_assessment(db_connection):
     """Test saving and retrieving a single assessment."""
     # 1. Save an assessment
@@ -99,3 +152,178 @@ def test_update_assessment_with_override(db_connection):
     assert updated_assessment['human_override_triage'] == override_triage
     assert updated_assessment['human_override_explanation'] == override_explanation
     assert updated_assessment['human_override_reason'] == override_reason
+
+def test_change_counter_tracks_assessment_changes(ddl_db_connection):
+    """Test that inserts and updates bump the assessments change counter."""
+    counter = get_change_counter("assessments", ddl_db_connection)
+    assert counter is not None
+    assert counter['version'] == 0
+
+    assessment_id = save_assessment("Engagement", "High Risk", "Senior Review", "Needs review", ddl_db_connection)
+    assert get_change_counter("assessments", ddl_db_connection)['version'] == 1
+
+    update_assessment_with_override(assessment_id, "Low Risk", "Auto-approve", "Fine.", "Clarified.", ddl_db_connection)
+    assert get_change_counter("assessments", ddl_db_connection)['version'] == 2
+
+def test_get_nonexistent_change_counter(ddl_db_connection):
+    """Test that an unknown table has no change counter."""
+    assert get_change_counter("unknown", ddl_db_connection) is None
+
+def test_reassessment_queue(ddl_db_connection):
+    """Test queuing, listing and completing a provisional assessment."""
+    assessment_id = save_assessment("Provisional engagement", "Medium Risk", "Junior Review", "Provisional.", ddl_db_connection)
+    enqueue_reassessment(assessment_id, "degraded mode", ddl_db_connection)
+    enqueue_reassessment(assessment_id, "degraded mode", ddl_db_connection)  # Queuing twice is a no-op
+
+    pending = get_pending_reassessments(db_connection=ddl_db_connection)
+    assert len(pending) == 1
+    assert pending[0]['assessment_id'] == assessment_id
+    assert pending[0]['engagement_details'] == "Provisional engagement"
+    assert pending[0]['attempts'] == 0
+
+    record_reassessment_attempt(assessment_id, ddl_db_connection)
+    assert get_pending_reassessments(db_connection=ddl_db_connection)[0]['attempts'] == 1
+
+    complete_reassessment(assessment_id, "High Risk", "Senior Review", "Full assessment.", ddl_db_connection)
+    assert get_pending_reassessments(db_connection=ddl_db_connection) == []
+    updated = get_assessment(assessment_id, ddl_db_connection)
+    assert updated['score'] == "High Risk"
+    assert updated['triage'] == "Senior Review"
+    assert updated['explanation'] == "Full assessment."
+
+def test_reassessment_queue_skips_failing_items(ddl_db_connection):
+    """Test that failed items move behind untried ones and stop being retried at max_attempts."""
+    failing = save_assessment("Failing engagement", "Medium Risk", "Junior Review", "Provisional.", ddl_db_connection)
+    waiting = save_assessment("Waiting engagement", "Medium Risk", "Junior Review", "Provisional.", ddl_db_connection)
+    enqueue_reassessment(failing, "degraded mode", ddl_db_connection)
+    enqueue_reassessment(waiting, "degraded mode", ddl_db_connection)
+
+    assert get_pending_reassessments(limit=1, db_connection=ddl_db_connection)[0]['assessment_id'] == failing
+    record_reassessment_attempt(failing, ddl_db_connection)
+    assert get_pending_reassessments(limit=1, db_connection=ddl_db_connection)[0]['assessment_id'] == waiting
+
+    record_reassessment_attempt(waiting, ddl_db_connection)
+    record_reassessment_attempt(failing, ddl_db_connection)
+    pending = get_pending_reassessments(max_attempts=2, db_connection=ddl_db_connection)
+    assert [item['assessment_id'] for item in pending] == [waiting]
+    # Items that are no longer retried stay provisional.
+    assert get_assessment(failing, ddl_db_connection)['provisional'] is True
+
+def test_provisional_flag_and_indexable_assessments(ddl_db_connection):
+    """Test that queued rows are flagged provisional and kept out of the k-NN index with parse failures."""
+    final = save_assessment("Final engagement", "Low Risk", "Auto-approve", "Fine.", ddl_db_connection)
+    provisional = save_assessment("Provisional engagement", "Medium Risk", "Junior Review", "Provisional.", ddl_db_connection)
+    save_assessment("Unparsed engagement", "Error", "Error", "Failed to parse LLM response.", ddl_db_connection)
+    version = get_change_counter("assessments", ddl_db_connection)['version']
+    enqueue_reassessment(provisional, "degraded mode", ddl_db_connection)
+    # Queue membership is part of the rows, so it changes the list validators.
+    assert get_change_counter("assessments", ddl_db_connection)['version'] == version + 1
+
+    flags = {a['id']: a['provisional'] for a in get_all_assessments(ddl_db_connection)}
+    assert flags[final] is False
+    assert flags[provisional] is True
+    assert get_assessments_by_ids([provisional], ddl_db_connection)[provisional]['provisional'] is True
+    assert [a['id'] for a in get_indexable_assessments(ddl_db_connection)] == [final]
+
+    complete_reassessment(provisional, "High Risk", "Senior Review", "Full assessment.", ddl_db_connection)
+    assert get_assessment(provisional, ddl_db_connection)['provisional'] is False
+    assert {a['id'] for a in get_indexable_assessments(ddl_db_connection)} == {final, provisional}
+
+def test_build_fts_query():
+    """Test that free text is turned into quoted FTS5 terms and phrases."""
+    assert build_fts_query('substitution clause') == '"substitution" "clause"'
+    assert build_fts_query('"substitution clause" Acme') == '"substitution clause" "Acme"'
+    assert build_fts_query('NOT -x:y') == '"NOT" "-x:y"'
+    assert build_fts_query('   ') == ''
+
+def test_highlight_snippet():
+    """Test that match markers survive HTML escaping as <mark> tags."""
+    assert highlight_snippet("a \ue000<b>\ue001 c") == "a <mark>&lt;b&gt;</mark> c"
+    assert highlight_snippet(None) is None
+
+def test_search_assessments(ddl_db_connection):
+    """Test ranked, highlighted and paginated full-text search."""
+    first = save_assessment("Contract with Acme Ltd includes a substitution clause.", "Low Risk", "Auto-approve", "Substitution is genuine.", ddl_db_connection)
+    save_assessment("Worker is under direct control of the BBC team.", "High Risk", "Senior Review", "Control points to employment.", ddl_db_connection)
+    third = save_assessment("Engagement via agency, no substitution right.", "High Risk", "Senior Review", "No right of substitution clause exists.", ddl_db_connection)
+
+    page = search_assessments('"substitution clause"', db_connection=ddl_db_connection)
+    assert page['total'] == 2
+    assert {hit['id'] for hit in page['results']} == {first, third}
+    assert all('<mark>' in hit['snippet'] for hit in page['results'])
+    assert page['results'][0]['relevance'] >= page['results'][1]['relevance']
+
+    page = search_assessments('substitution', limit=1, offset=1, db_connection=ddl_db_connection)
+    assert page['total'] == 2
+    assert len(page['results']) == 1
+
+    assert search_assessments('', db_connection=ddl_db_connection) == {"total": 0, "results": []}
+
+def test_search_snippets_are_html_escaped(ddl_db_connection):
+    """Test that stored text in snippets is escaped and only the match markers become tags."""
+    save_assessment('<script>alert("x")</script> Worker & agency <mark>substitution</mark> terms.', "Low Risk", "Auto-approve", "Fine.", ddl_db_connection)
+
+    snippet = search_assessments('substitution', db_connection=ddl_db_connection)['results'][0]['snippet']
+    assert '<script>' not in snippet
+    assert '&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;' in snippet
+    assert '&amp; agency' in snippet
+    assert '&lt;mark&gt;<mark>substitution</mark>&lt;/mark&gt;' in snippet
+
+def test_search_index_follows_updates(ddl_db_connection):
+    """Test that the FTS index is kept in sync with override reasons."""
+    assessment_id = save_assessment("Engagement for Project Kodiak.", "High Risk", "Senior Review", "Needs review.", ddl_db_connection)
+    assert search_assessments('clarified', db_connection=ddl_db_connection)['total'] == 0
+
+    update_assessment_with_override(assessment_id, "Low Risk", "Auto-approve", "Fine.", "Client clarified the terms.", ddl_db_connection)
+    results = search_assessments('clarified', db_connection=ddl_db_connection)['results']
+    assert [hit['id'] for hit in results] == [assessment_id]
+
+def test_search_index_backfill(db_connection):
+    """Test that rows created before the FTS index existed are backfilled once."""
+    assessment_id = save_assessment("Legacy engagement with Acme Ltd.", "Low Risk", "Auto-approve", "Fine.", db_connection)
+    db_connection.executescript(read_ddl_script())
+    db_connection.executescript(read_ddl_script())  # Re-applying the DDL must not duplicate entries
+
+    page = search_assessments('acme', db_connection=db_connection)
+    assert page['total'] == 1
+    assert page['results'][0]['id'] == assessment_id
+
+def test_get_assessments_by_ids(db_connection):
+    """Test retrieving several assessments by ID."""
+    first = save_assessment("Engagement 1", "Low Risk", "Auto-approve", "Explanation 1", db_connection)
+    second = save_assessment("Engagement 2", "High Risk", "Senior Review", "Explanation 2", db_connection)
+    records = get_assessments_by_ids([first, second, 999], db_connection)
+    assert set(records) == {first, second}
+    assert get_assessments_by_ids([], db_connection) == {}
+
+def test_get_override_records(db_connection):
+    """Test that override records are built from assessment rows, skipping non-overridden ones."""
+    overridden = save_assessment("Overridden engagement", "High Risk", "Senior Review", "Needs review", db_connection, "HR", "Contractors")
+    plain = save_assessment("Plain engagement", "Low Risk", "Auto-approve", "Fine", db_connection)
+    update_assessment_with_override(overridden, "Low Risk", "Auto-approve", "Actually fine.", "Client clarified the terms.", db_connection)
+
+    records = get_override_records([overridden, plain], db_connection)
+    assert set(records) == {overridden}
+    record = records[overridden]
+    assert record['assessment_id'] == overridden
+    assert record['original_engagement_details'] == "Overridden engagement"
+    assert (record['business_unit'], record['engagement_category']) == ("HR", "Contractors")
+    assert record['ai_assessment'] == {"score": "High Risk", "triage": "Senior Review", "explanation": "Needs review"}
+    assert record['human_override'] == {
+        "score": "Low Risk", "triage": "Auto-approve", "explanation": "Actually fine.", "reason": "Client clarified the terms."
+    }
+    assert get_override_records([], db_connection) == {}
+
+def test_update_override_record(db_connection):
+    """Test updating the text and decisions of an overridden assessment."""
+    assessment_id = save_assessment("Original text", "High Risk", "Senior Review", "Needs review", db_connection)
+    update_assessment_with_override(assessment_id, "Low Risk", "Auto-approve", "Fine.", "Clarified.", db_connection)
+
+    update_override_record(assessment_id, "Edited text", "High Risk", "Senior Review", "Needs review", "Medium Risk", "Junior Review", "Partly fine.", "Partly clarified.", db_connection)
+    record = get_override_records([assessment_id], db_connection)[assessment_id]
+    assert record['original_engagement_details'] == "Edited text"
+    assert record['human_override']['score'] == "Medium Risk"
+    assert record['human_override']['reason'] == "Partly clarified."
+
+    with pytest.raises(ValueError):
+        update_override_record(999, "x", "x", "x", "x", "x", "x", "x", "x", db_connection)
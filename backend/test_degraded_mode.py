@@ -0,0 +1,251 @@
+import asyncio
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import config
+import database
+import degraded_mode
+from database import save_assessment, enqueue_reassessment, get_assessment, get_pending_reassessments
+from degraded_mode import LLMHealthMonitor, knn_triage
+from schemas import AssessmentRequest, AssessmentResult
+
+# Importing assessment creates the vector store singleton; keep it off the real model and data.
+with patch("sentence_transformers.SentenceTransformer", lambda name: MagicMock()), \
+        patch.object(config, "CHROMA_DB_PATH", "./.pytest_cache/chroma_db"):
+    import assessment
+
+class FakeStore:
+    """Stands in for the vector store: no similar overrides, fixed k-NN neighbours."""
+    def __init__(self, neighbours=()):
+        self.neighbours = list(neighbours)
+        self.indexed = []
+
+    def find_similar_override(self, engagement_details, **kwargs):
+        return None, None
+
+    def find_nearest_decisions(self, engagement_details, n_results, **kwargs):
+        return [dict(neighbour) for neighbour in self.neighbours]
+
+    def find_similar_guidelines(self, engagement_details, n_results):
+        return []
+
+    def add_assessment(self, assessment_id, *args):
+        self.indexed.append(assessment_id)
+
+class FakeClient:
+    """A Bedrock client that answers after a delay, or raises."""
+    def __init__(self, content="", delay=0.0, error=None):
+        self.content = content
+        self.delay = delay
+        self.error = error
+
+    def invoke(self, prompt):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=self.content)
+
+LLM_RESPONSE = "**Assessment Score:** Low Risk\n**Triage Recommendation:** Auto-approve\n**Explanation:** Fine."
+
+def neighbour(score, triage, distance, is_override=False):
+    return {"score": score, "triage": triage, "distance": distance, "is_override": is_override}
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the monotonic clock seen by the health monitor."""
+    now = [1000.0]
+    monkeypatch.setattr(degraded_mode, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def health(monkeypatch):
+    """A fresh health monitor, also used by the assessment module."""
+    monitor = LLMHealthMonitor()
+    monkeypatch.setattr(assessment, "llm_health", monitor)
+    return monitor
+
+@pytest.fixture
+def store(monkeypatch):
+    fake = FakeStore([
+        neighbour("Low Risk", "Auto-approve", 0.2),
+        neighbour("Low Risk", "Auto-approve", 0.3),
+        neighbour("High Risk", "Senior Review", 0.9),
+    ])
+    monkeypatch.setattr(assessment, "vector_store", fake)
+    return fake
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database from the real DDL script, used by every database call."""
+    with open(os.path.join(os.path.dirname(__file__), "database_setup.sql"), "r") as f:
+        ddl_script = f.read()
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(ddl_script)
+    monkeypatch.setattr(database, "get_db_connection", lambda *args: conn)
+    yield conn
+    conn.close()
+
+def test_health_monitor_trips_on_error_rate(clock):
+    monitor = LLMHealthMonitor()
+    monitor.record(1.0, succeeded=False)
+    monitor.record(1.0, succeeded=False)
+    assert not monitor.is_degraded()  # Fewer than LLM_HEALTH_MIN_SAMPLES calls
+
+    monitor.record(1.0, succeeded=True)
+    assert monitor.is_degraded()
+    assert "error rate 67%" in monitor.last_trip_reason
+    # Samples are cleared so the next window starts afresh.
+    assert monitor.status()["recent_calls"] == 0
+
+def test_health_monitor_trips_on_p90_latency(clock):
+    monitor = LLMHealthMonitor()
+    for _ in range(config.LLM_HEALTH_MIN_SAMPLES - 1):
+        monitor.record(1.0, succeeded=True)
+    monitor.record(config.LLM_LATENCY_SLO_SECONDS + 1, succeeded=True)
+    assert monitor.is_degraded()
+    assert "p90 latency" in monitor.last_trip_reason
+
+    healthy = LLMHealthMonitor()
+    for _ in range(config.LLM_HEALTH_WINDOW):
+        healthy.record(1.0, succeeded=True)
+    assert not healthy.is_degraded()
+
+def test_health_monitor_cooldown_and_forced(clock):
+    monitor = LLMHealthMonitor()
+    monitor.trip("Bedrock client unavailable")
+    assert monitor.is_degraded()
+    assert monitor.last_trip_reason == "Bedrock client unavailable"
+
+    clock[0] += config.DEGRADED_MODE_COOLDOWN_SECONDS - 1
+    assert monitor.is_degraded()
+    assert monitor.status()["cooldown_remaining_seconds"] == 1.0
+    clock[0] += 1
+    assert not monitor.is_degraded()
+
+    monitor.forced = True
+    assert monitor.is_degraded() and monitor.status()["degraded"] is True
+    monitor.trip("outage")
+    monitor.forced = False
+    assert not monitor.is_degraded()
+    monitor.forced = None
+    assert monitor.is_degraded()
+
+def test_knn_triage_weights_by_distance():
+    result = knn_triage([
+        neighbour("High Risk", "Senior Review", 0.1),
+        neighbour("Low Risk", "Auto-approve", 0.5),
+        neighbour("Low Risk", "Auto-approve", 0.5),
+    ], "degraded mode")
+    # One close neighbour outweighs two distant ones.
+    assert (result.score, result.triage) == ("High Risk", "Senior Review")
+    assert result.provisional is True
+    assert "degraded mode" in result.explanation
+    assert "Score confidence: 71%" in result.explanation
+
+def test_knn_triage_weights_overrides():
+    neighbours = [
+        neighbour("Low Risk", "Auto-approve", 0.4),
+        neighbour("Low Risk", "Auto-approve", 0.4),
+        neighbour("High Risk", "Senior Review", 0.5, is_override=True),
+    ]
+    result = knn_triage(neighbours, "fast triage requested")
+    assert (result.score, result.triage) == ("High Risk", "Senior Review")
+    assert "(1 human overrides)" in result.explanation
+
+    neighbours[2]["is_override"] = False
+    assert knn_triage(neighbours, "fast triage requested").score == "Low Risk"
+
+def test_knn_triage_without_neighbours_routes_to_senior_review():
+    result = knn_triage([], "LLM unavailable")
+    assert (result.score, result.triage) == ("N/A", "Senior Review")
+    assert result.provisional is True
+
+def test_assess_engagement_uses_llm_when_healthy(monkeypatch, health, store):
+    monkeypatch.setattr(assessment, "get_llm", lambda: FakeClient(LLM_RESPONSE))
+    result, override = asyncio.run(assessment.assess_engagement(AssessmentRequest(engagement_details="Engagement")))
+    assert (result.score, result.provisional) == ("Low Risk", False)
+    assert override is None
+    assert health.status()["recent_calls"] == 1
+
+def test_assess_engagement_falls_back_when_llm_unavailable(monkeypatch, health, store):
+    monkeypatch.setattr(assessment, "get_llm", lambda: None)
+    result, override = asyncio.run(assessment.assess_engagement(AssessmentRequest(engagement_details="Engagement")))
+    assert (result.score, result.triage) == ("Low Risk", "Auto-approve")
+    assert result.provisional is True
+    assert "LLM unavailable" in result.explanation
+    assert override is None
+
+def test_assess_engagement_falls_back_on_timeout(monkeypatch, health, store):
+    monkeypatch.setattr(assessment, "LLM_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setattr(assessment, "get_llm", lambda: FakeClient(LLM_RESPONSE, delay=0.2))
+    result, _ = asyncio.run(assessment.assess_engagement(AssessmentRequest(engagement_details="Engagement")))
+    assert result.provisional is True
+    assert "LLM unavailable" in result.explanation
+    assert health.status()["recent_errors"] == 1
+
+def test_assess_engagement_skips_llm_in_degraded_mode(monkeypatch, health, store):
+    monkeypatch.setattr(assessment, "get_llm", lambda: pytest.fail("LLM must not be called"))
+    health.forced = True
+    result, _ = asyncio.run(assessment.assess_engagement(AssessmentRequest(engagement_details="Engagement")))
+    assert result.provisional is True and "degraded mode" in result.explanation
+
+    health.forced = False
+    request = AssessmentRequest(engagement_details="Engagement", fast_triage=True)
+    result, _ = asyncio.run(assessment.assess_engagement(request))
+    assert "fast triage requested" in result.explanation
+
+def queue_provisional(db, *texts):
+    ids = []
+    for text in texts:
+        assessment_id = save_assessment(text, "Low Risk", "Auto-approve", "Provisional.", db)
+        enqueue_reassessment(assessment_id, "degraded mode", db)
+        ids.append(assessment_id)
+    return ids
+
+def test_reassess_pending_stops_when_llm_unavailable(monkeypatch, health, store, db):
+    first, second, third = queue_provisional(db, "First", "Second", "Third")
+    results = iter([AssessmentResult(score="High Risk", triage="Senior Review", explanation="Full."), None])
+    calls = []
+
+    async def fake_run_llm_assessment(engagement_details):
+        calls.append(engagement_details)
+        return next(results)
+    monkeypatch.setattr(assessment, "run_llm_assessment", fake_run_llm_assessment)
+
+    asyncio.run(assessment.reassess_pending())
+    assert calls == ["First", "Second"]
+    assert get_assessment(first, db)["score"] == "High Risk"
+    assert get_assessment(first, db)["provisional"] is False
+    assert store.indexed == [first]
+    # The outage is not counted against the item.
+    pending = get_pending_reassessments(db_connection=db)
+    assert [(item["assessment_id"], item["attempts"]) for item in pending] == [(second, 0), (third, 0)]
+
+def test_reassess_pending_counts_unparseable_responses(monkeypatch, health, store, db):
+    first, second = queue_provisional(db, "First", "Second")
+    results = iter([
+        AssessmentResult(score="Error", triage="Error", explanation="Failed to parse."),
+        AssessmentResult(score="High Risk", triage="Senior Review", explanation="Full."),
+    ])
+
+    async def fake_run_llm_assessment(engagement_details):
+        return next(results)
+    monkeypatch.setattr(assessment, "run_llm_assessment", fake_run_llm_assessment)
+
+    asyncio.run(assessment.reassess_pending())
+    pending = get_pending_reassessments(db_connection=db)
+    assert [(item["assessment_id"], item["attempts"]) for item in pending] == [(first, 1)]
+    assert get_assessment(second, db)["provisional"] is False
+
+def test_reassess_pending_postponed_in_degraded_mode(monkeypatch, health, store, db):
+    queue_provisional(db, "First")
+    monkeypatch.setattr(assessment, "run_llm_assessment", lambda text: pytest.fail("LLM must not be called"))
+    health.forced = True
+    asyncio.run(assessment.reassess_pending())
+    assert get_pending_reassessments(db_connection=db)[0]["attempts"] == 0
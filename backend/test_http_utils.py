@@ -0,0 +1,84 @@
+import gzip
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import Request
+
+import http_utils
+from http_utils import make_etag, latest_timestamp, is_not_modified, negotiate_encoding, json_list_response, _etag_matches
+
+def make_request(**headers) -> Request:
+    """Builds a bare GET request carrying the given headers."""
+    raw_headers = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw_headers})
+
+def test_make_etag():
+    assert make_etag("assessments", 3) == 'W/"assessments-3"'
+
+def test_latest_timestamp():
+    earlier = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    later = datetime(2025, 1, 2, tzinfo=timezone.utc)
+    assert latest_timestamp(earlier, later) == later
+    assert latest_timestamp(later, None, earlier) == later
+    assert latest_timestamp(None, None) is None
+
+def test_etag_matches_weak_comparison():
+    etag = make_etag("assessments", 3)
+    assert _etag_matches('W/"assessments-3"', etag)
+    assert _etag_matches('"assessments-3"', etag)
+    assert _etag_matches('"other", W/"assessments-3"', etag)
+    assert _etag_matches("*", etag)
+    assert not _etag_matches('W/"assessments-4"', etag)
+    assert not _etag_matches('W/"assessments-3-"', etag)
+
+def test_is_not_modified_etag_takes_precedence():
+    etag = make_etag("assessments", 3)
+    last_modified = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    # If-None-Match is evaluated alone, even when If-Modified-Since would match.
+    request = make_request(if_none_match='W/"assessments-2"', if_modified_since="Wed, 01 Jan 2025 12:00:00 GMT")
+    assert not is_not_modified(request, etag, last_modified)
+    assert is_not_modified(make_request(if_none_match='W/"assessments-3"'), etag, last_modified)
+
+def test_is_not_modified_since():
+    etag = make_etag("assessments", 3)
+    last_modified = datetime(2025, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    assert is_not_modified(make_request(if_modified_since="Wed, 01 Jan 2025 12:00:00 GMT"), etag, last_modified)
+    assert not is_not_modified(make_request(if_modified_since="Wed, 01 Jan 2025 11:59:59 GMT"), etag, last_modified)
+    assert not is_not_modified(make_request(if_modified_since="not a date"), etag, last_modified)
+    assert not is_not_modified(make_request(if_modified_since="Wed, 01 Jan 2025 12:00:00 GMT"), etag, None)
+    assert not is_not_modified(make_request(), etag, last_modified)
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("*", "br"),
+    ("*;q=0.5, gzip;q=0", "br"),
+    ("gzip;q=bogus", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    if expected == "br" and http_utils.brotli is None:
+        expected = "gzip"
+    assert negotiate_encoding(accept_encoding) == expected
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(http_utils, "brotli", None)
+    assert negotiate_encoding("br, gzip;q=0.1") == "gzip"
+    assert negotiate_encoding("br") is None
+
+def test_json_list_response_compresses_large_bodies(monkeypatch):
+    monkeypatch.setattr(http_utils, "brotli", None)
+    content = [{"id": i, "engagement_details": "x" * 100} for i in range(20)]
+    etag = make_etag("assessments", 1)
+
+    response = json_list_response(make_request(accept_encoding="gzip"), content, etag)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == etag
+    assert gzip.decompress(response.body).startswith(b'[{"id":0')
+
+    small = json_list_response(make_request(accept_encoding="gzip"), content[:1], etag)
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,117 @@
+import json
+import logging
+import queue
+import sys
+
+import logging_config
+from logging_config import (
+    summarize_text, LazySummary, JsonFormatter, TextFormatter, RequestContextFilter, DeferredQueueHandler,
+    start_request_context, end_request_context, annotate, timed
+)
+from data_loader import process_pages
+
+class CountingText(str):
+    """Counts how often the payload is read for summarising."""
+    reads = 0
+
+    def encode(self, *args, **kwargs):
+        CountingText.reads += 1
+        return super().encode(*args, **kwargs)
+
+def make_record(level=logging.INFO, msg="message %s", args=("arg",), exc_info=None, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("assessment", level, __file__, 1, msg, args, exc_info)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+def test_summarize_text(monkeypatch):
+    summary = summarize_text("confidential engagement")
+    assert summary.startswith("<23 chars sha256:")
+    assert "confidential" not in summary
+    assert summarize_text(None) == "<none>"
+
+    monkeypatch.setattr(logging_config, "LOG_PAYLOAD_PREVIEW_CHARS", 4)
+    assert summarize_text("confidential engagement").endswith(" 'conf'")
+
+def test_json_formatter_includes_extra_and_traceback():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(level=logging.ERROR, exc_info=sys.exc_info(), engagement=LazySummary("text"))
+    record.request_id = "abc123"
+
+    # Records go through the queue handler first, as in setup_logging.
+    log_queue = queue.SimpleQueue()
+    DeferredQueueHandler(log_queue).handle(record)
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+
+    assert entry["msg"] == "message arg"
+    assert entry["request_id"] == "abc123"
+    assert entry["engagement"] == summarize_text("text")
+    assert "ValueError: boom" in entry["exc"]
+    assert "Traceback" not in entry["msg"]
+
+def test_text_formatter_appends_extra_fields():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record(level=logging.ERROR, exc_info=sys.exc_info(), status=200, engagement=LazySummary("text"))
+    record.request_id = "abc123"
+
+    first_line, *rest = TextFormatter().format(record).splitlines()
+    assert first_line.endswith(f"[abc123] message arg status=200 engagement={summarize_text('text')}")
+    assert rest[-1] == "ValueError: boom"
+
+def test_unsampled_debug_payload_is_never_summarised(monkeypatch):
+    monkeypatch.setattr(logging_config, "LOG_DEBUG_SAMPLE_RATE", 0.0)
+    CountingText.reads = 0
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter())
+
+    context = start_request_context("req-1")
+    try:
+        handler.handle(make_record(level=logging.DEBUG, engagement=LazySummary(CountingText("payload"))))
+        handler.handle(make_record(level=logging.INFO, engagement=LazySummary(CountingText("payload"))))
+    finally:
+        end_request_context(context)
+
+    assert log_queue.qsize() == 1
+    record = log_queue.get_nowait()
+    assert record.request_id == "req-1"
+    assert CountingText.reads == 0
+    JsonFormatter().format(record)
+    assert CountingText.reads == 1
+
+def test_request_context_validates_client_request_id():
+    for client_id, kept in [("req-1.a_B", True), ("", False), ("x" * 65, False), ("id\ninjected", False), ("<script>", False)]:
+        context = start_request_context(client_id)
+        end_request_context(context)
+        assert (context["request_id"] == client_id) is kept
+        assert logging_config.REQUEST_ID_PATTERN.fullmatch(context["request_id"])
+
+def test_request_context_collects_timings_and_fields():
+    context = start_request_context()
+    try:
+        with timed("db_ms"):
+            pass
+        with timed("db_ms"):
+            pass
+        annotate(cache="hit")
+    finally:
+        end_request_context(context)
+    assert set(context["timings"]) == {"db_ms"}
+    assert context["fields"] == {"cache": "hit"}
+    # Outside a request these are no-ops.
+    annotate(ignored=True)
+    with timed("ignored_ms"):
+        pass
+
+def test_pool_workers_log(capfd):
+    # Pages without any content log an error from whichever process parses them.
+    pages = [(f"https://example.gov.uk/empty-{i}", b"") for i in range(2)]
+    assert process_pages(pages, workers=2) == []
+    # Formatted by the workers' own handlers, not Python's last-resort handler.
+    entries = [json.loads(line) for line in capfd.readouterr().err.splitlines() if line.startswith("{")]
+    errors = [e for e in entries if e["logger"] == "data_loader" and "Could not find main content" in e["msg"]]
+    assert len(errors) == 2
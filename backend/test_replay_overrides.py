@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from replay_overrides import pairwise_distances, nearest_overrides, replay, same_partition
+
+EMBEDDINGS = np.array([
+    [1.0, 0.0],
+    [0.9, 0.1],
+    [0.0, 1.0],
+    [0.1, 0.9],
+], dtype=np.float32)
+
+def make_record(score, triage, human_score=None, human_triage=None):
+    return {
+        "score": score,
+        "triage": triage,
+        "human_override_score": human_score,
+        "human_override_triage": human_triage,
+    }
+
+def test_pairwise_distances_match_chromadb_spaces():
+    embeddings = np.array([[1.0, 0.0], [0.0, 2.0]], dtype=np.float32)
+
+    l2 = pairwise_distances(embeddings, "l2")
+    assert l2[0, 1] == pytest.approx(5.0)  # squared L2
+    assert np.allclose(np.diag(l2), 0.0)
+
+    cosine = pairwise_distances(embeddings, "cosine")
+    assert cosine[0, 1] == pytest.approx(1.0)
+    assert cosine[1, 1] == pytest.approx(0.0)
+
+    ip = pairwise_distances(embeddings, "ip")
+    assert ip[0, 1] == pytest.approx(1.0)
+    assert ip[1, 1] == pytest.approx(-3.0)
+
+    with pytest.raises(ValueError):
+        pairwise_distances(embeddings, "manhattan")
+
+def test_nearest_overrides_leaves_one_out():
+    distances = pairwise_distances(EMBEDDINGS, "l2")
+    override_mask = np.array([True, True, False, False])
+    neighbours, nearest = nearest_overrides(distances, override_mask)
+
+    # Overridden records never match themselves.
+    assert neighbours[0] == 1 and neighbours[1] == 0
+    assert neighbours[2] == 1 and neighbours[3] == 1
+    assert nearest[0] == pytest.approx(distances[0, 1])
+
+    neighbours, nearest = nearest_overrides(distances, np.array([True, False, False, False]))
+    assert neighbours[0] == -1 and np.isinf(nearest[0])
+
+def test_replay_measures_agreement_against_human_decisions():
+    records = [
+        make_record("Low", "Fast Track", "High", "Senior Review"),
+        make_record("Low", "Fast Track", "High", "Standard Review"),
+        make_record("Low", "Fast Track", "Medium", "Standard Review"),
+        make_record("High", "Senior Review"),
+    ]
+    report = replay(records, EMBEDDINGS, ["l2"], [0.05, 10.0], llm_latency=2.0)
+    tight, loose = report
+
+    # 0 <-> 1 are close; 2 and 3 are close to each other, but only 2 carries an override.
+    assert tight["hits"] == 3 and tight["human_hits"] == 2 and tight["ai_hits"] == 1
+    assert tight["score_agreement"] == pytest.approx(1.0)
+    assert tight["triage_agreement"] == pytest.approx(0.0)
+    assert tight["wrong_reuses"] == 0
+    # Record 3 kept its AI result, which is not counted as human ground truth.
+    assert tight["ai_score_agreement"] == pytest.approx(0.0)
+    assert tight["latency_saved_s"] == pytest.approx(6.0)
+
+    assert loose["hits"] == 4 and loose["human_hits"] == 3
+    assert loose["wrong_reuses"] == 1  # record 2 is matched to a "High" override
+
+def test_replay_partitioned_only_matches_within_partition():
+    records = [
+        make_record("Low", "Fast Track", "High", "Senior Review"),
+        make_record("Low", "Fast Track", "High", "Senior Review"),
+    ]
+    records[0]["business_unit"] = "HR"
+    records[1]["business_unit"] = "Finance"
+    assert not same_partition(records)[0, 1]
+
+    assert replay(records, EMBEDDINGS[:2], ["l2"], [1.0], llm_latency=1.0)[0]["hits"] == 2
+    assert replay(records, EMBEDDINGS[:2], ["l2"], [1.0], llm_latency=1.0, partitioned=True)[0]["hits"] == 0
+
+    records[1]["business_unit"] = " hr "
+    assert replay(records, EMBEDDINGS[:2], ["l2"], [1.0], llm_latency=1.0, partitioned=True)[0]["hits"] == 2
+
+def test_same_partition_follows_service_lookup_rules():
+    records = [make_record("Low", "Fast Track") for _ in range(4)]
+    records[0].update(business_unit="HR", engagement_category="Contractors")
+    records[1].update(business_unit="HR")
+    records[2].update(business_unit="Human Resources!", engagement_category="contractors")
+    # records[3] has no keys.
+    records.append(dict(records[2], business_unit="human resources"))
+    mask = same_partition(records)
+
+    # A lookup by business unit alone searches that unit's categorised partitions, not vice versa.
+    assert mask[1, 0] and not mask[0, 1]
+    # Keys are compared as slugs.
+    assert mask[2, 4] and mask[4, 2] and not mask[0, 2]
+    # Without keys, only overrides without keys are searched.
+    assert mask[3, 3] and not mask[3, 1] and not mask[1, 3]
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import config
+import database
+from database import save_assessment
+
+# Importing search creates the vector store singleton; keep it off the real model and data.
+with patch("sentence_transformers.SentenceTransformer", lambda name: MagicMock()), \
+        patch.object(config, "CHROMA_DB_PATH", "./.pytest_cache/chroma_db"):
+    import search
+
+K = config.SEARCH_RRF_K
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database from the real DDL script, used by every database call."""
+    with open(os.path.join(os.path.dirname(__file__), "database_setup.sql"), "r") as f:
+        ddl_script = f.read()
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(ddl_script)
+    monkeypatch.setattr(database, "get_db_connection", lambda *args: conn)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def assessments(db):
+    return {
+        "lexical": save_assessment("Contractor supplies a substitute for payroll work.", "Low Risk", "Auto-approve", "Fine.", db),
+        "both": save_assessment("Payroll consultant with a substitution clause.", "Low Risk", "Auto-approve", "Fine.", db),
+        "semantic": save_assessment("Office manager working set hours.", "High Risk", "Senior Review", "Controlled.", db),
+        "distant": save_assessment("Gardener on a fixed contract.", "Medium Risk", "Junior Review", "Unclear.", db),
+    }
+
+@pytest.fixture
+def vector_hits(monkeypatch, assessments):
+    """Stubs the override lookup with fixed (assessment_id, distance) pairs, nearest first."""
+    hits = [
+        (assessments["semantic"], 0.4),
+        (assessments["both"], 0.6),
+        (assessments["distant"], config.SEARCH_MAX_VECTOR_DISTANCE + 0.1),
+    ]
+    calls = []
+
+    def find_similar_override_assessments(query, n_results=20):
+        calls.append(n_results)
+        return hits[:n_results]
+    monkeypatch.setattr(search.vector_store, "find_similar_override_assessments", find_similar_override_assessments)
+    return calls
+
+def lexical_ranks(query):
+    return {hit["id"]: rank for rank, hit in enumerate(database.search_assessments(query)["results"])}
+
+def test_lexical_search_labels_matches(assessments, vector_hits):
+    page = search.search("payroll")
+    assert page["total"] == 2
+    assert {hit["match"] for hit in page["results"]} == {"lexical"}
+    assert vector_hits == []
+
+def test_semantic_search_merges_with_reciprocal_rank_fusion(assessments, vector_hits):
+    ranks = lexical_ranks("payroll")
+    page = search.search("payroll", semantic=True)
+    hits = {hit["id"]: hit for hit in page["results"]}
+
+    # Hits beyond the distance cut-off are dropped.
+    assert set(hits) == {assessments["lexical"], assessments["both"], assessments["semantic"]}
+    assert hits[assessments["lexical"]]["match"] == "lexical"
+    assert hits[assessments["both"]]["match"] == "both"
+    assert hits[assessments["semantic"]]["match"] == "semantic"
+
+    assert hits[assessments["lexical"]]["relevance"] == pytest.approx(1 / (K + 1 + ranks[assessments["lexical"]]))
+    assert hits[assessments["both"]]["relevance"] == pytest.approx(1 / (K + 1 + ranks[assessments["both"]]) + 1 / (K + 2))
+    assert hits[assessments["semantic"]]["relevance"] == pytest.approx(1 / (K + 1))
+    # Found by both searches, so ranked first.
+    assert page["results"][0]["id"] == assessments["both"]
+    relevances = [hit["relevance"] for hit in page["results"]]
+    assert relevances == sorted(relevances, reverse=True)
+
+def test_semantic_only_hits_have_no_snippet(assessments, vector_hits):
+    hits = {hit["id"]: hit for hit in search.search("payroll", semantic=True)["results"]}
+    semantic = hits[assessments["semantic"]]
+    assert semantic["snippet"] is None
+    assert semantic["engagement_details"] == "Office manager working set hours."
+    assert semantic["provisional"] is False
+    assert "<mark>" in hits[assessments["both"]]["snippet"]
+
+def test_semantic_search_total_and_offset(assessments, vector_hits):
+    full = search.search("payroll", semantic=True)
+    # All lexical matches plus the vector-only hit.
+    assert full["total"] == 3
+
+    page = search.search("payroll", limit=1, offset=1, semantic=True)
+    assert (page["limit"], page["offset"], page["total"]) == (1, 1, 3)
+    assert [hit["id"] for hit in page["results"]] == [full["results"][1]["id"]]
+    # Both searches fetch the whole window up to the requested page.
+    assert vector_hits[-1] == 2
+
+    assert search.search("payroll", limit=5, offset=3, semantic=True)["results"] == []
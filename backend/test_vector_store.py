@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import sqlite3
+import zlib
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+import config
+import database
+from database import save_assessment, update_assessment_with_override
+from schemas import OverrideRequest
+
+class StubModel:
+    """Deterministic bag-of-words embeddings, standing in for the sentence transformer."""
+    dimension = 32
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+# Importing the module creates the singleton store; keep it off the real model and data.
+with patch("sentence_transformers.SentenceTransformer", lambda name: StubModel()), \
+        patch.object(config, "CHROMA_DB_PATH", "./.pytest_cache/chroma_db"):
+    import vector_store
+from vector_store import VectorStore, partition_matches, assessment_partition_filter, override_partition_name, partition_slug
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database from the real DDL script, used by every database call of the store."""
+    with open(os.path.join(os.path.dirname(__file__), "database_setup.sql"), "r") as f:
+        ddl_script = f.read()
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript(ddl_script)
+    monkeypatch.setattr(database, "get_db_connection", lambda *args: conn)
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, db):
+    """A VectorStore on a fresh ChromaDB directory with the stub model, also used as the module singleton."""
+    monkeypatch.setattr(vector_store, "SentenceTransformer", lambda name: StubModel())
+    monkeypatch.setattr(vector_store, "CHROMA_DB_PATH", str(tmp_path / "chroma"))
+    instance = VectorStore()
+    monkeypatch.setattr(vector_store, "vector_store", instance)
+    return instance
+
+def make_override(db, text, score="Low Risk", business_unit=None, engagement_category=None) -> OverrideRequest:
+    """Saves an assessment with a human override and returns the matching OverrideRequest."""
+    assessment_id = save_assessment(text, "High Risk", "Senior Review", "AI explanation.", db, business_unit, engagement_category)
+    update_assessment_with_override(assessment_id, score, "Auto-approve", "Human explanation.", "Human reason.", db)
+    return OverrideRequest(
+        assessment_id=assessment_id,
+        original_engagement_details=text,
+        ai_assessment={"score": "High Risk", "triage": "Senior Review", "explanation": "AI explanation."},
+        human_override={"score": score, "triage": "Auto-approve", "explanation": "Human explanation.", "reason": "Human reason."},
+        business_unit=business_unit,
+        engagement_category=engagement_category,
+    )
+
+def test_partition_matches():
+    hr_contractors = override_partition_name("HR", "Contractors")
+    hr_unspecified = override_partition_name("HR")
+    finance = override_partition_name("Finance", "Contractors")
+
+    assert partition_matches(hr_contractors, "hr", "contractors")
+    assert not partition_matches(hr_unspecified, "HR", "Contractors")
+    # A missing key matches every value of that key.
+    assert partition_matches(hr_contractors, "HR")
+    assert partition_matches(hr_unspecified, "HR")
+    assert not partition_matches(finance, "HR")
+    assert partition_matches(finance, engagement_category="Contractors")
+    # Without keys, only the unpartitioned collection matches.
+    assert partition_matches(config.OVERRIDE_COLLECTION_NAME)
+    assert not partition_matches(hr_contractors)
+    assert not partition_matches(config.OVERRIDE_COLLECTION_NAME, "HR")
+
+def test_partition_slug():
+    assert partition_slug(" Human Resources ") == "human-resources"
+    assert partition_slug(None) == partition_slug("") == partition_slug("!!") == "any"
+    # Truncated before stripping, so a slug never ends in a hyphen.
+    slug = partition_slug("a" * 59 + " b")
+    assert slug == "a" * 59
+    # The literal value "any" must not land in the unspecified slot.
+    assert partition_slug("Any") == "_any"
+    assert override_partition_name("Any", "Contractors") != override_partition_name(engagement_category="Contractors")
+    assert partition_matches(override_partition_name("HR", "any"), "HR", "ANY")
+    assert not partition_matches(override_partition_name("HR"), "HR", "any")
+
+def test_assessment_partition_filter():
+    assert assessment_partition_filter() is None
+    assert assessment_partition_filter("Human Resources") == {"business_unit": "human-resources"}
+    assert assessment_partition_filter("HR", "Contractors") == {
+        "$and": [{"business_unit": "hr"}, {"engagement_category": "contractors"}]
+    }
+
+def test_find_similar_override_uses_partial_partition_keys(store, db):
+    text = "Contractor supplies own equipment and may send a substitute."
+    store.add_override(make_override(db, text, business_unit="HR", engagement_category="Contractors"))
+
+    override, distance = store.find_similar_override(text, business_unit="HR")
+    assert override is not None and distance == pytest.approx(0.0, abs=1e-5)
+    assert override["business_unit"] == "HR"
+
+    # Other business units only match with the global fallback.
+    assert store.find_similar_override(text, business_unit="Finance", global_fallback=False) == (None, None)
+    override, _ = store.find_similar_override(text, business_unit="Finance", global_fallback=True)
+    assert override is not None
+
+def test_global_fallback_uses_stricter_threshold(store, db):
+    store.add_override(make_override(db, "Contractor supplies own equipment and may send a substitute.", business_unit="HR"))
+    query = "Contractor supplies own laptop and may send a substitute worker."
+
+    _, distance = store.find_similar_override(query, threshold=10.0, business_unit="HR")
+    assert distance is not None and distance > 0.05
+    assert store.find_similar_override(query, threshold=10.0, business_unit="Finance", global_fallback=True, fallback_threshold=0.05) == (None, None)
+    override, _ = store.find_similar_override(query, threshold=10.0, business_unit="Finance", global_fallback=True, fallback_threshold=10.0)
+    assert override is not None
+
+def test_nearest_decisions_vote_within_partition(store, db):
+    text = "Worker is supervised daily by the client team."
+    save_assessment(text, "High Risk", "Senior Review", "Control.", db, "HR")
+    finance_id = save_assessment(text, "Low Risk", "Auto-approve", "Fine.", db, "Finance")
+    store.backfill_assessments(database.get_indexable_assessments(db))
+
+    decisions = store.find_nearest_decisions(text, 5, business_unit="HR")
+    assert [d["score"] for d in decisions] == ["High Risk"]
+    assert {d["score"] for d in store.find_nearest_decisions(text, 5)} == {"High Risk", "Low Risk"}
+    assert store.assessment_collection.get(ids=[f"assessment_{finance_id}"])["metadatas"][0]["business_unit"] == "finance"
+
+def add_legacy_override(collection, override: OverrideRequest, model: StubModel, vector_id: str):
+    """Stores an override the way it was stored before compaction: text as document, JSON as metadata."""
+    details = override.model_dump()
+    collection.add(
+        ids=[vector_id],
+        embeddings=model.encode([override.original_engagement_details]),
+        documents=[override.original_engagement_details],
+        metadatas=[{"override_details": json.dumps(details)}],
+    )
+
+def test_add_override_embeds_stored_text(store, db):
+    stored = "Contractor supplies own equipment and may send a substitute."
+    override = make_override(db, stored)
+    override.original_engagement_details = "Unrelated text sent by the client."
+    store.add_override(override)
+
+    result = store.override_collection.get(ids=[f"override_{override.assessment_id}"], include=["metadatas", "documents"])
+    assert result["metadatas"] == [{"assessment_id": override.assessment_id}]
+    assert result["documents"] == [None]
+    _, distance = store.find_similar_override(stored)
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+def test_add_override_partitions_by_assessment_keys(store, db):
+    # Assessed under HR, then overridden by a client that does not send the keys.
+    text = "Contractor supplies own equipment and may send a substitute."
+    override = make_override(db, text, business_unit="HR", engagement_category="Contractors")
+    override.business_unit = override.engagement_category = None
+    store.add_override(override)
+
+    assert store.override_collection.count() == 0
+    found, _ = store.find_similar_override(text, business_unit="HR", engagement_category="Contractors")
+    assert found is not None and found["assessment_id"] == override.assessment_id
+    # Mismatched request keys do not move the override either.
+    override.business_unit = "Finance"
+    store.add_override(override)
+    assert store.find_similar_override(text, business_unit="Finance") == (None, None)
+    assert store.find_similar_override(text, business_unit="HR")[0] is not None
+
+    # Assessments stored without keys fall back to the request's keys.
+    legacy = make_override(db, "Worker is supervised daily by the client team.")
+    legacy.business_unit = "Finance"
+    store.add_override(legacy)
+    assert store.find_similar_override(legacy.original_engagement_details, business_unit="Finance")[0] is not None
+
+def test_add_override_requires_stored_override(store, db):
+    assessment_id = save_assessment("No override yet.", "High Risk", "Senior Review", "AI explanation.", db)
+    override = make_override(db, "Other engagement.")
+    override.assessment_id = assessment_id
+    with pytest.raises(ValueError):
+        store.add_override(override)
+    assert store.override_collection.count() == 0
+
+    with pytest.raises(ValueError):
+        update_assessment_with_override(9999, "Low Risk", "Auto-approve", "Fine.", "Reason.", db)
+
+def test_update_override_keeps_vector_when_encoding_fails(store, db):
+    override = make_override(db, "Contractor supplies own equipment.")
+    store.add_override(override)
+    vector_id = f"override_{override.assessment_id}"
+    data = override.model_dump()
+    data["original_engagement_details"] = "Contractor now works fixed hours."
+
+    with patch.object(store.model, "encode", side_effect=RuntimeError("model unavailable")):
+        with pytest.raises(RuntimeError):
+            vector_store.update_override(vector_id, data)
+    assert store.override_collection.get(ids=[vector_id])["ids"] == [vector_id]
+    assert database.get_assessment(override.assessment_id, db)["engagement_details"] == "Contractor supplies own equipment."
+
+    vector_store.update_override(vector_id, data)
+    assert database.get_assessment(override.assessment_id, db)["engagement_details"] == "Contractor now works fixed hours."
+    _, distance = store.find_similar_override("Contractor now works fixed hours.")
+    assert distance == pytest.approx(0.0, abs=1e-5)
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("float32", 1e-6)])
+def test_snapshot_and_restore_round_trip(store, db, tmp_path, monkeypatch, dtype, tolerance):
+    overrides = [
+        make_override(db, "Contractor supplies own equipment and may send a substitute."),
+        make_override(db, "Worker is supervised daily by the client team.", score="High Risk", business_unit="HR", engagement_category="Contractors"),
+    ]
+    for override in overrides:
+        store.add_override(override)
+    original = {}
+    for collection in store.override_partitions.values():
+        result = collection.get(include=["embeddings"])
+        original.update(zip(result["ids"], result["embeddings"]))
+
+    path = str(tmp_path / "snapshots" / "overrides")
+    summary = store.snapshot_overrides(path, dtype)
+    assert summary["count"] == 2
+    matrix = np.load(path + ".npy", mmap_mode="r")
+    assert matrix.dtype == np.dtype(dtype) and matrix.shape == (2, StubModel.dimension)
+    assert not os.path.exists(path + ".npy.tmp")
+
+    # Restore into an empty store
+    monkeypatch.setattr(vector_store, "CHROMA_DB_PATH", str(tmp_path / "restored"))
+    restored = VectorStore()
+    assert restored.restore_overrides(path)["count"] == 2
+
+    hr = restored.get_override_partition("HR", "Contractors")
+    assert hr is not None and hr.metadata == {"business_unit": "HR", "engagement_category": "Contractors"}
+    for collection in restored.override_partitions.values():
+        result = collection.get(include=["embeddings", "metadatas"])
+        for vector_id, embedding, metadata in zip(result["ids"], result["embeddings"], result["metadatas"]):
+            assert np.allclose(embedding, original[vector_id], atol=tolerance)
+            assert vector_id == f"override_{metadata['assessment_id']}"
+    override, _ = restored.find_similar_override("Worker is supervised daily by the client team.", business_unit="HR")
+    assert override["human_override"]["score"] == "High Risk"
+
+def test_restore_rejects_mismatched_snapshots(store, db, tmp_path):
+    store.add_override(make_override(db, "Contractor supplies own equipment."))
+    path = str(tmp_path / "overrides")
+    store.snapshot_overrides(path)
+
+    with open(path + ".json") as f:
+        manifest = json.load(f)
+    with open(path + ".json", "w") as f:
+        json.dump(dict(manifest, count=2), f)
+    with pytest.raises(ValueError, match="shape"):
+        store.restore_overrides(path)
+
+    with open(path + ".json", "w") as f:
+        json.dump(dict(manifest, model="another-model"), f)
+    with pytest.raises(ValueError, match="model"):
+        store.restore_overrides(path)
+
+    with pytest.raises(FileNotFoundError):
+        store.restore_overrides(str(tmp_path / "missing"))
+
+def test_compact_legacy_overrides(store, db):
+    model = store.model
+    # Overridden in SQLite, same text: the embedding is reused.
+    kept = make_override(db, "Contractor supplies own equipment.")
+    add_legacy_override(store.override_collection, kept, model, "legacy-1")
+    # Override only in the vector store: copied to SQLite first.
+    unsaved_id = save_assessment("Worker is supervised daily.", "High Risk", "Senior Review", "AI explanation.", db)
+    unsaved = make_override(db, "Placeholder.")
+    unsaved.assessment_id = unsaved_id
+    unsaved.original_engagement_details = "Worker is supervised daily."
+    add_legacy_override(store.override_collection, unsaved, model, "legacy-2")
+    # Assessment no longer exists: left untouched.
+    orphan = make_override(db, "Orphaned engagement.")
+    orphan.assessment_id = 9999
+    add_legacy_override(store.override_collection, orphan, model, "legacy-3")
+    # Edited in the vector store since (the old PUT /overrides): the legacy JSON is newer and wins.
+    edited = make_override(db, "Engagement before edit.")
+    edited.original_engagement_details = "Engagement after edit."
+    edited.human_override.score = "Medium Risk"
+    edited.human_override.reason = "Edited reason."
+    add_legacy_override(store.override_collection, edited, model, "legacy-4")
+
+    # Every legacy embedding is reused rather than re-encoded.
+    with patch.object(store.model, "encode", side_effect=AssertionError("re-encoded")):
+        assert store.compact_legacy_overrides() == 3
+    assert store.compact_legacy_overrides() == 0  # Idempotent
+
+    ids = set(store.override_collection.get()["ids"])
+    assert ids == {f"override_{kept.assessment_id}", f"override_{unsaved_id}", f"override_{edited.assessment_id}", "legacy-3"}
+    assert database.get_assessment(unsaved_id, db)["human_override_score"] == "Low Risk"
+    records = {r["assessment_id"]: r for r in vector_store.get_all_overrides()}
+    assert records[unsaved_id]["original_engagement_details"] == "Worker is supervised daily."
+    assert 9999 in records  # Still served from its legacy JSON
+    row = database.get_assessment(edited.assessment_id, db)
+    assert row["engagement_details"] == "Engagement after edit."
+    assert (row["human_override_score"], row["human_override_reason"]) == ("Medium Risk", "Edited reason.")
+    assert records[edited.assessment_id]["human_override"]["score"] == "Medium Risk"
+    _, distance = store.find_similar_override("Engagement after edit.")
+    assert distance == pytest.approx(0.0, abs=1e-5)
@@ -1,23 +1,61 @@
 from sentence_transformers import SentenceTransformer
 import chromadb
+import numpy as np
 import logging
 import json
+import os
 import uuid
-from typing import List, Tuple
+from datetime import datetime, timezone
+from typing import List, Tuple, Dict, Any, Optional
 
-from config import EMBEDDING_MODEL_NAME, CHROMA_DB_PATH, HMRC_COLLECTION_NAME, OVERRIDE_COLLECTION_NAME
-from schemas import OverrideRequest
+from config import EMBEDDING_MODEL_NAME, CHROMA_DB_PATH, HMRC_COLLECTION_NAME, OVERRIDE_COLLECTION_NAME, ASSESSMENT_COLLECTION_NAME, OVERRIDE_SIMILARITY_THRESHOLD, OVERRIDE_GLOBAL_FALLBACK, OVERRIDE_GLOBAL_FALLBACK_THRESHOLD, OVERRIDE_SNAPSHOT_PATH, OVERRIDE_SNAPSHOT_DTYPE
+from schemas import OverrideRequest, GuidelineChunk
+from database import get_override_records, update_override_record
+from partitions import PARTITION_SEPARATOR, partition_slug, override_partition_name, partition_matches, assessment_partition_filter
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_BATCH_SIZE = 1000
+
+def _assessment_metadata(assessment_id: int, score: str, triage: str, business_unit: Optional[str], engagement_category: Optional[str]) -> dict:
+    return {
+        "assessment_id": assessment_id,
+        "score": score,
+        "triage": triage,
+        "business_unit": partition_slug(business_unit),
+        "engagement_category": partition_slug(engagement_category),
+    }
+
+def override_vector_id(assessment_id: int) -> str:
+    """Vector IDs of compact overrides reference the assessment they were made on."""
+    return f"override_{assessment_id}"
+
+def override_assessment_id(metadata: Optional[dict]) -> Optional[int]:
+    """
+    Returns the assessment an override vector refers to. Compact records store only the
+    assessment ID; legacy records embed the whole override as JSON.
+    """
+    if not metadata:
+        return None
+    if "assessment_id" in metadata:
+        return metadata["assessment_id"]
+    if "override_details" in metadata:
+        return json.loads(metadata["override_details"]).get("assessment_id")
+    return None
+
 class VectorStore:
     def __init__(self):
         self.model = self._load_embedding_model()
         self.client = self._get_chroma_client()
         self.hmrc_collection = self._get_or_create_collection(HMRC_COLLECTION_NAME)
         self.override_collection = self._get_or_create_collection(OVERRIDE_COLLECTION_NAME)
+        self.override_partitions = self._load_override_partitions()
+        self.assessment_collection = self._get_or_create_collection(ASSESSMENT_COLLECTION_NAME)
+        # Change counter for the override collection, used for HTTP cache validators.
+        # The instance id keeps validators from colliding across server restarts.
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.override_version = 0
+        self.override_updated_at = datetime.now(timezone.utc)
 
     def _load_embedding_model(self):
         try:
@@ -39,17 +77,72 @@ class VectorStore:
             logger.error(f"Error initializing ChromaDB client: {e}")
             raise
 
-    def _get_or_create_collection(self, name: str):
+    def _get_or_create_collection(self, name: str, metadata: Optional[Dict[str, str]] = None):
         try:
             logger.info(f"Getting or creating ChromaDB collection: {name}")
-            collection = self.client.get_or_create_collection(name=name)
+            collection = self.client.get_or_create_collection(name=name, metadata=metadata or None)
             logger.info(f"Collection '{name}' ready. Current count: {collection.count()}")
             return collection
         except Exception as e:
             logger.error(f"Error getting or creating collection '{name}': {e}")
             raise
 
-    def populate_hmrc_guidelines(self, hmrc_chunks: List[str]):
+    def _load_override_partitions(self) -> Dict[str, Any]:
+        """Loads the default override collection and every existing partition collection."""
+        partitions = {OVERRIDE_COLLECTION_NAME: self.override_collection}
+        prefix = OVERRIDE_COLLECTION_NAME + PARTITION_SEPARATOR
+        for collection in self.client.list_collections():
+            # Depending on the ChromaDB version, list_collections returns names or collections.
+            name = collection if isinstance(collection, str) else collection.name
+            if name.startswith(prefix):
+                partitions[name] = self.client.get_collection(name=name)
+        logger.info(f"Loaded {len(partitions)} override partitions.")
+        return partitions
+
+    def get_override_partition(self, business_unit: Optional[str] = None, engagement_category: Optional[str] = None, create: bool = False):
+        """Returns the override collection for a partition, optionally creating it. None if it does not exist."""
+        name = override_partition_name(business_unit, engagement_category)
+        if name not in self.override_partitions and create:
+            metadata = {k: v for k, v in {"business_unit": business_unit, "engagement_category": engagement_category}.items() if v}
+            self.override_partitions[name] = self._get_or_create_collection(name, metadata)
+        return self.override_partitions.get(name)
+
+    def matching_override_partitions(self, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> List[Any]:
+        """The override collections serving a lookup with the given (possibly partial) keys."""
+        return [c for name, c in self.override_partitions.items() if partition_matches(name, business_unit, engagement_category)]
+
+    def _override_collections(self, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> List[Any]:
+        """The collections matching the given partition keys if any are given, otherwise all partitions."""
+        if business_unit or engagement_category:
+            return self.matching_override_partitions(business_unit, engagement_category)
+        return list(self.override_partitions.values())
+
+    def find_override_collection(self, override_id: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
+        """Finds the partition collection holding an override ID, or None. Partition keys narrow the search."""
+        for collection in self._override_collections(business_unit, engagement_category):
+            if collection.get(ids=[override_id], include=[])['ids']:
+                return collection
+        return None
+
+    def list_override_partitions(self) -> List[Dict[str, Any]]:
+        """Lists override partitions with their keys and record counts."""
+        partitions = []
+        for name, collection in self.override_partitions.items():
+            metadata = collection.metadata or {}
+            partitions.append({
+                "name": name,
+                "business_unit": metadata.get("business_unit"),
+                "engagement_category": metadata.get("engagement_category"),
+                "count": collection.count(),
+            })
+        return partitions
+
+    def mark_overrides_changed(self):
+        """Bumps the override collection change counter."""
+        self.override_version += 1
+        self.override_updated_at = datetime.now(timezone.utc)
+
+    def populate_hmrc_guidelines(self, hmrc_chunks: List[GuidelineChunk]):
         if not hmrc_chunks:
             logger.warning("HMRC guideline chunks are empty. Skipping population.")
             return
@@ -60,13 +153,19 @@ class VectorStore:
 
         try:
             logger.info(f"Populating HMRC guidelines collection with {len(hmrc_chunks)} chunks...")
-            embeddings = self.model.encode(hmrc_chunks, show_progress_bar=True)
+            documents = [chunk.text for chunk in hmrc_chunks]
+            embeddings = self.model.encode(documents, show_progress_bar=True)
             ids = [f"hmrc_{i}" for i in range(len(hmrc_chunks))]
+            metadatas = [
+                {"source_url": chunk.source_url, "heading_path": " > ".join(chunk.heading_path)}
+                for chunk in hmrc_chunks
+            ]
             
             self.hmrc_collection.add(
-                embeddings=embeddings.tolist(),
-                documents=hmrc_chunks,
-                ids=ids
+                embeddings=embeddings,
+                documents=documents,
+                ids=ids,
+                metadatas=metadatas
             )
             logger.info(f"HMRC collection populated successfully. Total items: {self.hmrc_collection.count()}")
         except Exception as e:
@@ -74,109 +173,457 @@ class VectorStore:
             raise
 
     def add_override(self, override_data: OverrideRequest):
+        """
+        Stores the embedding of an override. The text and decisions live in SQLite
+        (the assessment row); the vector record only references the assessment ID.
+        The override must already be saved there, and the stored text is embedded.
+        It is partitioned by the keys the assessment was made under; the request's keys
+        are only used for assessments stored without keys.
+        """
         try:
-            engagement_text = override_data.original_engagement_details
+            records = get_override_records([override_data.assessment_id])
+            if override_data.assessment_id not in records:
+                raise ValueError(f"Assessment {override_data.assessment_id} has no stored human override.")
+            record = records[override_data.assessment_id]
+            engagement_text = record["original_engagement_details"]
+            for key in ("business_unit", "engagement_category"):
+                requested = getattr(override_data, key)
+                if record[key] and requested and partition_slug(requested) != partition_slug(record[key]):
+                    logger.warning(f"Override {key} '{requested}' differs from assessment {override_data.assessment_id}'s '{record[key]}'; using the assessment's.")
+            business_unit = record["business_unit"] or override_data.business_unit
+            engagement_category = record["engagement_category"] or override_data.engagement_category
             logger.info("Adding new override to vector store...")
             
-            embedding = self.model.encode([engagement_text]).tolist()[0]
+            embeddings = self.model.encode([engagement_text])
             
-            # Generate a truly unique ID
-            new_id = f"override_{uuid.uuid4()}"
-
-            # Serialize the full override object to store in metadata
-            metadata = {"override_details": override_data.json()}
+            # One override per assessment: a repeated override replaces the previous one.
+            new_id = override_vector_id(override_data.assessment_id)
+            collection = self.get_override_partition(business_unit, engagement_category, create=True)
+            previous = self.find_override_collection(new_id)
+            if previous is not None and previous is not collection:
+                previous.delete(ids=[new_id])
 
-            self.override_collection.add(
-                embeddings=[embedding],
-                documents=[engagement_text],
+            collection.upsert(
+                embeddings=embeddings,
                 ids=[new_id],
-                metadatas=[metadata]
+                metadatas=[{"assessment_id": override_data.assessment_id}]
             )
+            self.mark_overrides_changed()
             
-            logger.info(f"Successfully added override with ID: {new_id}")
+            logger.info(f"Successfully added override with ID: {new_id} to partition '{collection.name}'")
         except Exception as e:
             logger.error(f"Failed to add override to vector store: {e}")
             raise
 
+    def load_override_records(self, entries: List[Tuple[str, Optional[dict], Any]]) -> List[Optional[dict]]:
+        """
+        Resolves (vector_id, metadata, collection) entries into full override records,
+        reading text and decisions from SQLite in one query. Legacy records that are not
+        linked to an assessment fall back to their embedded JSON. None if unresolvable.
+        """
+        assessment_ids = [override_assessment_id(metadata) for _, metadata, _ in entries]
+        records = get_override_records([a for a in assessment_ids if a is not None])
+
+        resolved = []
+        for (vector_id, metadata, collection), assessment_id in zip(entries, assessment_ids):
+            if assessment_id in records:
+                record = dict(records[assessment_id])
+            elif metadata and "override_details" in metadata:
+                record = json.loads(metadata["override_details"])
+            else:
+                logger.warning(f"Override {vector_id} has no matching assessment record.")
+                resolved.append(None)
+                continue
+            partition_keys = collection.metadata or {}
+            record["chroma_id"] = vector_id
+            record["business_unit"] = partition_keys.get("business_unit")
+            record["engagement_category"] = partition_keys.get("engagement_category")
+            resolved.append(record)
+        return resolved
+
+    def compact_legacy_overrides(self) -> int:
+        """
+        Rewrites legacy override vectors (engagement text as document plus the full
+        override as JSON metadata) into compact records that reference SQLite.
+        Overrides used to be edited in the vector store only, so the legacy JSON is the
+        newer copy: where it differs from the assessment row, it is written to SQLite first.
+        The stored embedding, made from the legacy text, is reused.
+        Legacy records whose assessment cannot be found are left untouched.
+        """
+        compacted = 0
+        for collection in self.override_partitions.values():
+            results = collection.get(include=["metadatas", "embeddings"])
+            legacy = [
+                (vector_id, metadata, embedding)
+                for vector_id, metadata, embedding in zip(results['ids'], results['metadatas'], results['embeddings'])
+                if metadata and "override_details" in metadata
+            ]
+            if not legacy:
+                continue
+
+            details = [json.loads(metadata["override_details"]) for _, metadata, _ in legacy]
+            known = get_override_records([d["assessment_id"] for d in details if d.get("assessment_id") is not None])
+            for (vector_id, _, embedding), override in zip(legacy, details):
+                assessment_id = override.get("assessment_id")
+                if assessment_id is None:
+                    continue
+                # Make sure SQLite holds the legacy text and decisions before dropping them from the vector store.
+                try:
+                    ai, human = override["ai_assessment"], override["human_override"]
+                    legacy_record = {
+                        "original_engagement_details": override["original_engagement_details"],
+                        "ai_assessment": {key: ai[key] for key in ("score", "triage", "explanation")},
+                        "human_override": {key: human.get(key) for key in ("score", "triage", "explanation", "reason")},
+                    }
+                    stored = known.get(assessment_id)
+                    if stored is None or any(stored[key] != value for key, value in legacy_record.items()):
+                        update_override_record(
+                            assessment_id, legacy_record["original_engagement_details"],
+                            ai["score"], ai["triage"], ai["explanation"],
+                            human["score"], human.get("triage"), human["explanation"], human["reason"]
+                        )
+                except Exception as e:
+                    logger.warning(f"Could not copy legacy override {vector_id} to SQLite: {e}")
+                    continue
+
+                # Write the compact record before removing the legacy one.
+                collection.upsert(
+                    embeddings=np.asarray([embedding], dtype=np.float32),
+                    ids=[override_vector_id(assessment_id)],
+                    metadatas=[{"assessment_id": assessment_id}]
+                )
+                collection.delete(ids=[vector_id])
+                compacted += 1
+
+        if compacted:
+            self.mark_overrides_changed()
+        logger.info(f"Compacted {compacted} legacy override records.")
+        return compacted
+
+    def snapshot_overrides(self, path: str = OVERRIDE_SNAPSHOT_PATH, dtype: str = OVERRIDE_SNAPSHOT_DTYPE) -> Dict[str, Any]:
+        """
+        Writes all compact override embeddings to `<path>.npy` (a memory-mappable
+        float32/float16 matrix) and their IDs and partitions to `<path>.json`.
+        """
+        ids, assessment_ids, partitions, vectors = [], [], [], []
+        partition_keys = {}
+        for name, collection in self.override_partitions.items():
+            results = collection.get(include=["metadatas", "embeddings"])
+            for vector_id, metadata, embedding in zip(results['ids'], results['metadatas'], results['embeddings']):
+                assessment_id = override_assessment_id(metadata)
+                if assessment_id is None:
+                    continue
+                ids.append(vector_id)
+                assessment_ids.append(assessment_id)
+                partitions.append(name)
+                vectors.append(embedding)
+            partition_keys[name] = dict(collection.metadata or {})
+
+        dimension = self.model.get_sentence_embedding_dimension()
+        matrix = np.asarray(vectors, dtype=dtype).reshape(len(ids), dimension)
+        manifest = {
+            "model": EMBEDDING_MODEL_NAME,
+            "dtype": dtype,
+            "dimension": dimension,
+            "count": len(ids),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "partitions": partition_keys,
+            "ids": ids,
+            "assessment_ids": assessment_ids,
+            "row_partitions": partitions,
+        }
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Write to temporary files first so a crash never leaves a half-written snapshot.
+        with open(path + ".npy.tmp", "wb") as f:
+            np.save(f, matrix)
+        with open(path + ".json.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".npy.tmp", path + ".npy")
+        os.replace(path + ".json.tmp", path + ".json")
+        logger.info(f"Wrote override snapshot of {len(ids)} embeddings ({matrix.nbytes} bytes, {dtype}) to {path}")
+        return {"path": path, "count": len(ids), "dtype": dtype, "bytes": matrix.nbytes}
+
+    def restore_overrides(self, path: str = OVERRIDE_SNAPSHOT_PATH) -> Dict[str, Any]:
+        """Loads override embeddings from a snapshot into their partitions, without re-encoding."""
+        with open(path + ".json", "r") as f:
+            manifest = json.load(f)
+        if manifest["model"] != EMBEDDING_MODEL_NAME:
+            raise ValueError(f"Snapshot was made with model '{manifest['model']}', but '{EMBEDDING_MODEL_NAME}' is configured.")
+
+        matrix = np.load(path + ".npy", mmap_mode="r")
+        if matrix.shape != (manifest["count"], manifest["dimension"]):
+            raise ValueError(f"Snapshot matrix shape {matrix.shape} does not match its manifest.")
+
+        rows_by_partition: Dict[str, List[int]] = {}
+        for row, name in enumerate(manifest["row_partitions"]):
+            rows_by_partition.setdefault(name, []).append(row)
+
+        for name, rows in rows_by_partition.items():
+            keys = manifest["partitions"].get(name, {})
+            collection = self.get_override_partition(keys.get("business_unit"), keys.get("engagement_category"), create=True)
+            for start in range(0, len(rows), SNAPSHOT_BATCH_SIZE):
+                batch = rows[start:start + SNAPSHOT_BATCH_SIZE]
+                collection.upsert(
+                    embeddings=np.asarray(matrix[batch], dtype=np.float32),
+                    ids=[manifest["ids"][row] for row in batch],
+                    metadatas=[{"assessment_id": manifest["assessment_ids"][row]} for row in batch]
+                )
+
+        self.mark_overrides_changed()
+        logger.info(f"Restored {manifest['count']} override embeddings from {path}")
+        return {"path": path, "count": manifest["count"], "dtype": manifest["dtype"]}
+
+    def add_assessment(self, assessment_id: int, engagement_details: str, score: str, triage: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
+        """Stores a completed (non-provisional) assessment for nearest-neighbour triage."""
+        try:
+            self.assessment_collection.upsert(
+                embeddings=self.model.encode([engagement_details]),
+                ids=[f"assessment_{assessment_id}"],
+                metadatas=[_assessment_metadata(assessment_id, score, triage, business_unit, engagement_category)]
+            )
+            logger.debug("Added assessment %s to assessment history collection.", assessment_id)
+        except Exception as e:
+            logger.error(f"Failed to add assessment {assessment_id} to vector store: {e}")
+            raise
+
+    def backfill_assessments(self, assessments: List[Dict[str, Any]]):
+        """
+        Adds stored assessments that are missing from the assessment history collection,
+        or were indexed before partition keys were recorded.
+        """
+        stored = self.assessment_collection.get(include=["metadatas"])
+        existing = {
+            vector_id for vector_id, metadata in zip(stored['ids'], stored['metadatas'])
+            if metadata and "business_unit" in metadata
+        }
+        missing = [a for a in assessments if f"assessment_{a['id']}" not in existing]
+        if not missing:
+            logger.info("Assessment history collection is up to date.")
+            return
+
+        logger.info(f"Backfilling {len(missing)} assessments into the assessment history collection...")
+        embeddings = self.model.encode([a['engagement_details'] for a in missing])
+        self.assessment_collection.upsert(
+            embeddings=embeddings,
+            ids=[f"assessment_{a['id']}" for a in missing],
+            metadatas=[
+                _assessment_metadata(a['id'], a['score'], a['triage'], a.get('business_unit'), a.get('engagement_category'))
+                for a in missing
+            ]
+        )
+        logger.info(f"Assessment history backfill complete. Total items: {self.assessment_collection.count()}")
+
+    def _query_overrides(self, embeddings: np.ndarray, n_results: int, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> List[Tuple[str, dict, float, Any]]:
+        """Queries the override partitions and returns the nearest (vector_id, metadata, distance, collection) tuples."""
+        matches = []
+        for collection in self._override_collections(business_unit, engagement_category):
+            count = collection.count()
+            if count == 0:
+                continue
+            results = collection.query(
+                query_embeddings=embeddings,
+                n_results=min(n_results, count),
+                include=["metadatas", "distances"]
+            )
+            matches.extend(
+                (vector_id, metadata, distance, collection)
+                for vector_id, metadata, distance in zip(results['ids'][0], results['metadatas'][0], results['distances'][0])
+            )
+        matches.sort(key=lambda match: match[2])
+        return matches[:n_results]
+
+    def find_nearest_decisions(self, text: str, n_results: int, business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the nearest past decisions for a text, from both human overrides (in the
+        given partition, or all partitions) and AI assessments. An AI assessment that was
+        later overridden is represented by its override only.
+        """
+        embeddings = self.model.encode([text])
+        decisions = []
+        overridden_ids = set()
+
+        matches = self._query_overrides(embeddings, n_results, business_unit, engagement_category)
+        records = self.load_override_records([(vector_id, metadata, collection) for vector_id, metadata, _, collection in matches])
+        for (_, _, distance, _), override in zip(matches, records):
+            if override is None:
+                continue
+            overridden_ids.add(override.get('assessment_id'))
+            decisions.append({
+                "score": override['human_override']['score'],
+                "triage": override['human_override'].get('triage') or "N/A",
+                "distance": distance,
+                "is_override": True,
+            })
+
+        if self.assessment_collection.count() > 0:
+            # AI assessments vote only within the same partition as the overrides.
+            results = self.assessment_collection.query(
+                query_embeddings=embeddings,
+                n_results=min(n_results, self.assessment_collection.count()),
+                where=assessment_partition_filter(business_unit, engagement_category),
+                include=["metadatas", "distances"]
+            )
+            for metadata, distance in zip(results['metadatas'][0], results['distances'][0]):
+                if not metadata or metadata.get('assessment_id') in overridden_ids:
+                    continue
+                decisions.append({
+                    "score": metadata['score'],
+                    "triage": metadata['triage'],
+                    "distance": distance,
+                    "is_override": False,
+                })
+
+        decisions.sort(key=lambda d: d['distance'])
+        return decisions[:n_results]
+
+    def find_similar_override_assessments(self, text: str, n_results: int = 20) -> List[Tuple[int, float]]:
+        """Returns (assessment_id, distance) pairs for the overrides nearest to a text, across all partitions."""
+        if not any(collection.count() for collection in self.override_partitions.values()):
+            return []
+
+        embeddings = self.model.encode([text])
+        hits = []
+        for _, metadata, distance, _ in self._query_overrides(embeddings, n_results):
+            assessment_id = override_assessment_id(metadata)
+            if assessment_id is not None:
+                hits.append((assessment_id, distance))
+        return hits
+
     def find_similar_guidelines(self, text: str, n_results: int = 5) -> List[str]:
-        embedding = self.model.encode([text]).tolist()[0]
         results = self.hmrc_collection.query(
-            query_embeddings=[embedding],
+            query_embeddings=self.model.encode([text]),
             n_results=n_results
         )
         return results['documents'][0] if results['documents'] else []
 
-    def find_similar_override(self, text: str, threshold: float = 0.5) -> Tuple[dict, float] | Tuple[None, None]:
-        
-        if self.override_collection.count() == 0:
-            logger.info("Override collection is empty. No similar cases to find.")
+    def find_similar_override(
+        self,
+        text: str,
+        threshold: float = OVERRIDE_SIMILARITY_THRESHOLD,
+        business_unit: Optional[str] = None,
+        engagement_category: Optional[str] = None,
+        global_fallback: bool = OVERRIDE_GLOBAL_FALLBACK,
+        fallback_threshold: float = OVERRIDE_GLOBAL_FALLBACK_THRESHOLD,
+    ) -> Tuple[dict, float] | Tuple[None, None]:
+        """
+        Finds the closest human override within the partitions matching the request's keys.
+        With global_fallback, all other partitions are searched if those have no match,
+        with the stricter fallback_threshold.
+        """
+        partition = override_partition_name(business_unit, engagement_category)
+        counts = {
+            name: collection.count()
+            for name, collection in self.override_partitions.items()
+            if global_fallback or partition_matches(name, business_unit, engagement_category)
+        }
+        home = [
+            self.override_partitions[name] for name, count in counts.items()
+            if count and partition_matches(name, business_unit, engagement_category)
+        ]
+        others = [
+            self.override_partitions[name] for name, count in counts.items()
+            if count and not partition_matches(name, business_unit, engagement_category)
+        ]
+
+        if not home and not others:
+            logger.debug("Override collections are empty. No similar cases to find.")
             return None, None
 
-        embedding = self.model.encode([text]).tolist()[0]
-        results = self.override_collection.query(
-            query_embeddings=[embedding],
-            n_results=1,
-            include=["metadatas", "distances"] 
-        )
-        
-        logger.info(f"ChromaDB query results for similarity: {results}")
+        embeddings = self.model.encode([text])
 
-        if results['distances'] and results['distances'][0] and results['distances'][0][0] < threshold:
-            distance = results['distances'][0][0]
-            metadata = results['metadatas'][0][0]
-            
-            if metadata and "override_details" in metadata:
-                # Deserialize the JSON string from metadata back into a Python dict
-                similar_override_data = json.loads(metadata["override_details"])
-                logger.info(f"Found similar override at distance {distance:.2f}")
+        stages = [("partition", home, threshold)]
+        if others:
+            stages.append(("global fallback", others, min(threshold, fallback_threshold)))
+        for stage, collections, stage_threshold in stages:
+            candidates = []
+            for collection in collections:
+                results = collection.query(
+                    query_embeddings=embeddings,
+                    n_results=1,
+                    include=["metadatas", "distances"]
+                )
+                logger.debug("Override similarity query", extra={"collection": collection.name, "distances": results['distances']})
+                if results['distances'] and results['distances'][0]:
+                    candidates.append((results['distances'][0][0], results['ids'][0][0], results['metadatas'][0][0], collection))
+
+            if not candidates:
+                continue
+            distance, vector_id, metadata, collection = min(candidates, key=lambda candidate: candidate[0])
+            if distance >= stage_threshold:
+                continue
+
+            # Read the override's text and decisions from SQLite
+            similar_override_data = self.load_override_records([(vector_id, metadata, collection)])[0]
+            if similar_override_data is not None:
+                logger.debug("Found similar override at distance %.2f (%s: %s)", distance, stage, partition)
                 return similar_override_data, distance
-            else:
-                logger.warning("Found a similar case, but its metadata was missing the 'override_details' key.")
         
         return None, None
 
 # Singleton instance
 vector_store = VectorStore()
 
-def get_all_overrides() -> List[dict]:
-    """Retrieves all override records from the vector store."""
-    logger.info("Fetching all override records...")
-    results = vector_store.override_collection.get(include=["metadatas"])
+def get_all_overrides(business_unit: Optional[str] = None, engagement_category: Optional[str] = None) -> List[dict]:
+    """Retrieves override records, for one partition or all partitions, with their text from SQLite."""
+    logger.debug("Fetching all override records...")
     
-    all_overrides = []
-    for i, metadata in enumerate(results.get('metadatas', [])):
-        if metadata and 'override_details' in metadata:
-            override_data = json.loads(metadata['override_details'])
-            # Add the ChromaDB ID to the record
-            override_data['chroma_id'] = results['ids'][i]
-            all_overrides.append(override_data)
+    entries = []
+    for collection in vector_store._override_collections(business_unit, engagement_category):
+        results = collection.get(include=["metadatas"])
+        entries.extend((vector_id, metadata, collection) for vector_id, metadata in zip(results['ids'], results['metadatas']))
+    all_overrides = [record for record in vector_store.load_override_records(entries) if record is not None]
             
-    logger.info(f"Found {len(all_overrides)} override records.")
+    logger.debug("Found %d override records.", len(all_overrides))
     return all_overrides
 
-def update_override(override_id: str, override_data: dict):
-    """Updates a specific override record in the vector store."""
+def _locate_override(override_id: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
+    collection = vector_store.find_override_collection(override_id, business_unit, engagement_category)
+    if collection is None:
+        raise ValueError(f"Override {override_id} was not found in any partition.")
+    return collection
+
+def update_override(override_id: str, override_data: dict, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
+    """Updates a specific override record: its text and decisions in SQLite, and its embedding."""
     logger.info(f"Updating override record with ID: {override_id}")
+    collection = _locate_override(override_id, business_unit, engagement_category)
     
-    # We need to update the document and its metadata.
-    # ChromaDB's update/upsert works on IDs.
     engagement_text = override_data.get('original_engagement_details')
     if not engagement_text:
         raise ValueError("original_engagement_details is required to update an override.")
 
-    embedding = vector_store.model.encode([engagement_text]).tolist()[0]
-    metadata = {"override_details": json.dumps(override_data)}
+    existing = collection.get(ids=[override_id], include=["metadatas"])
+    assessment_id = override_assessment_id(existing['metadatas'][0] if existing['metadatas'] else None)
+    if assessment_id is None:
+        raise ValueError(f"Override {override_id} is not linked to an assessment and cannot be updated.")
 
-    vector_store.override_collection.update(
+    # Encode before changing anything, so a failure leaves the stored override intact.
+    embeddings = vector_store.model.encode([engagement_text])
+    ai, human = override_data['ai_assessment'], override_data['human_override']
+    update_override_record(
+        assessment_id, engagement_text,
+        ai['score'], ai['triage'], ai['explanation'],
+        human['score'], human.get('triage'), human['explanation'], human['reason']
+    )
+
+    # Delete and re-add, so legacy records also lose their stored document and JSON.
+    collection.delete(ids=[override_id])
+    collection.upsert(
         ids=[override_id],
-        embeddings=[embedding],
-        documents=[engagement_text],
-        metadatas=[metadata]
+        embeddings=embeddings,
+        metadatas=[{"assessment_id": assessment_id}]
     )
+    vector_store.mark_overrides_changed()
     logger.info(f"Successfully updated override: {override_id}")
 
-def delete_override(override_id: str):
-    """Deletes a specific override record from the vector store."""
+def delete_override(override_id: str, business_unit: Optional[str] = None, engagement_category: Optional[str] = None):
+    """Deletes a specific override record from the vector store, within its partition."""
     logger.info(f"Deleting override record with ID: {override_id}")
-    vector_store.override_collection.delete(ids=[override_id])
+    collection = _locate_override(override_id, business_unit, engagement_category)
+    collection.delete(ids=[override_id])
+    vector_store.mark_overrides_changed()
     logger.info(f"Successfully deleted override: {override_id}")
+
+def get_override_partitions() -> List[dict]:
+    """Lists the override partitions and their record counts."""
+    return vector_store.list_override_partitions()